@@ -0,0 +1,246 @@
+import argparse
+import asyncio
+import datetime
+import functools
+import http.server
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+
+# Tables the benchmark (re)creates; never point this at a production database
+BENCH_TABLES = [
+    "live_vehicle_positions", "conflict_events", "disruptions", "live_permits",
+    "routes", "stops", "trips", "shapes", "shape_geoms",
+]
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+def serve_directory(path):
+    """Serves the synthetic dataset so the engines fetch it exactly like the live feeds."""
+    handler = functools.partial(QuietHandler, directory=path)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+def summarize(samples):
+    ordered = sorted(samples)
+    return {
+        "n": len(ordered),
+        "min_ms": round(ordered[0] * 1000, 3),
+        "median_ms": round(statistics.median(ordered) * 1000, 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def checked(fn, *args, expect=None, **kwargs):
+    """
+    The engine entry points print and swallow their errors and return None;
+    a failed cycle must abort the run, not be reported as a fast sample.
+    With expect, the returned row count must match it too (lossy ingests fail).
+    """
+    def call():
+        result = fn(*args, **kwargs)
+        if result is None:
+            raise RuntimeError(f"{fn.__name__} failed; see the error above")
+        if expect is not None and result != expect:
+            raise RuntimeError(f"{fn.__name__} wrote {result} rows, expected {expect}")
+    return call
+
+def reset_database(conn):
+    cur = conn.cursor()
+    cur.execute("CREATE EXTENSION IF NOT EXISTS postgis;")
+    for table in BENCH_TABLES:
+        cur.execute(f"DROP TABLE IF EXISTS {table} CASCADE;")
+    conn.commit()
+    cur.close()
+
+def load_history(conn, vehicles, routes, days, interval=30):
+    """
+    Bulk-loads days of past pings straight in SQL; replaying them through
+    fetch_and_process would take as long as the history itself.
+    """
+    cur = conn.cursor()
+    cur.execute("SELECT setseed(0.42);")
+    cur.execute("""
+        INSERT INTO live_vehicle_positions
+        (vehicle_id, trip_id, route_id, latitude, longitude, bearing, speed, timestamp, geom)
+        SELECT
+            'BUS-' || v,
+            NULL,
+            ((v %% %s) + 1)::text,
+            lat, lon,
+            random() * 360,
+            random() * 15,
+            ts,
+            ST_SetSRID(ST_MakePoint(lon, lat), 4326)
+        FROM (
+            SELECT v, ts,
+                43.2557 + (random() - 0.5) * 0.1 AS lat,
+                -79.8711 + (random() - 0.5) * 0.15 AS lon
+            FROM generate_series(0, %s - 1) v
+            CROSS JOIN generate_series(
+                NOW() - make_interval(days => %s), NOW() - INTERVAL '10 minutes', make_interval(secs => %s)
+            ) ts
+        ) p;
+    """, (routes, vehicles, days, interval))
+    rows = cur.rowcount
+    cur.execute("ANALYZE live_vehicle_positions;")
+    conn.commit()
+    cur.close()
+    return rows
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return None
+
+def run(args):
+    # Settings resolve lazily on first connection; load_dotenv never overrides it
+    os.environ["DB_NAME"] = args.dbname
+
+    from benchmarks import synthetic
+    from engine import ingest_static, ingest_permits, ingest_realtime, detect_conflicts
+    from engine.settings import get_db_connection
+
+    results = {}
+    data_dir = tempfile.mkdtemp(prefix="transitmind_bench_")
+
+    print(f"🧪 Generating synthetic dataset in {data_dir}...")
+    start = time.perf_counter()
+    # The GTFS-RT feeds are written just before they are polled, so they are still fresh
+    network = synthetic.write_dataset(data_dir, routes=args.routes, trips_per_route=args.trips_per_route,
+                                      permits=args.permits, seed=args.seed, realtime=False)
+    results["generate_dataset"] = summarize([time.perf_counter() - start])
+
+    server, base_url = serve_directory(data_dir)
+    conn = get_db_connection()
+    if not conn:
+        return None
+
+    try:
+        reset_database(conn)
+        ingest_realtime.initialize_schema(conn)
+        detect_conflicts.initialize_schema(conn)
+
+        # 1. Ingest paths (the real engine functions, fed over local HTTP)
+        print("⏱️  ingest_static...")
+        results["ingest_static"] = summarize(timed(
+            checked(ingest_static.ingest_static, url=f"{base_url}/google_transit.zip"), 1))
+
+        urls = {layer: f"{base_url}/permits/{layer}.json" for layer in synthetic.PERMIT_LAYERS}
+        print("⏱️  ingest_layers...")
+        results["ingest_layers"] = summarize(timed(
+            checked(ingest_permits.ingest_layers, urls=urls, expect=args.permits), args.repeat))
+
+        if args.days:
+            print(f"⏱️  Loading {args.days} day(s) of ping history...")
+            start = time.perf_counter()
+            rows = load_history(conn, args.vehicles, args.routes, args.days)
+            results["load_history"] = {**summarize([time.perf_counter() - start]), "rows": rows}
+
+        print("⏱️  fetch_and_process...")
+        synthetic.write_realtime(data_dir, network, vehicles=args.vehicles, snapshots=args.snapshots)
+        samples = []
+        for n in range(args.snapshots):
+            samples += timed(checked(ingest_realtime.fetch_and_process, conn, feed_url=f"{base_url}/realtime/{n}.pb"), 1)
+        results["fetch_and_process"] = summarize(samples)
+
+        # 2. The diagnostic query on its own, then a full cycle including the event log
+        print("⏱️  Diagnostic query...")
+        row_counts, live_counts = [], []
+        def diagnostic_query():
+            cur = conn.cursor()
+            cur.execute(detect_conflicts.DIAGNOSTIC_SQL)
+            rows = cur.fetchall()
+            row_counts.append(len(rows))
+            live_counts.append(sum(1 for row in rows if row[0] == "LIVE_IMPACT"))
+            cur.close()
+        results["diagnostic_query"] = {
+            **summarize(timed(diagnostic_query, args.repeat)),
+            "rows": row_counts[-1], "live_impact_rows": live_counts[-1],
+        }
+        # Without fresh pings inside a work zone the live-impact path is never exercised
+        if not live_counts[-1]:
+            raise RuntimeError("diagnostic returned no LIVE_IMPACT rows; the timing does not cover check_d_live")
+
+        print("⏱️  detect_conflicts...")
+        # The first cycle opens every event; later cycles should write almost nothing
+        detect_cycle = checked(detect_conflicts.detect_conflicts)
+        results["detect_conflicts_first_cycle"] = summarize(timed(detect_cycle, 1))
+        results["detect_conflicts_steady"] = summarize(timed(detect_cycle, args.repeat))
+
+        # 3. API routes, called directly to exclude HTTP server overhead
+        print("⏱️  API routes...")
+        from web import api
+        for name, route in [
+            ("api_static_routes", api.get_static_routes),
+            ("api_live_buses", api.get_live_buses),
+            ("api_conflicts", api.get_conflicts),
+            ("api_permits", api.get_permits),
+        ]:
+            sizes = []
+            def call():
+                sizes.append(len(asyncio.run(route()).body))
+            results[name] = {**summarize(timed(call, args.repeat)), "response_bytes": sizes[-1]}
+    finally:
+        conn.close()
+        server.shutdown()
+
+    return {
+        "meta": {
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "scale": {
+                "routes": args.routes, "trips_per_route": args.trips_per_route,
+                "vehicles": args.vehicles, "snapshots": args.snapshots,
+                "days": args.days, "permits": args.permits, "seed": args.seed,
+            },
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="TransitMind benchmark suite (drops and recreates tables in --dbname).")
+    parser.add_argument("--dbname", required=True, help="Scratch PostGIS database; its TransitMind tables are dropped.")
+    parser.add_argument("--routes", type=int, default=35)
+    parser.add_argument("--trips-per-route", type=int, default=100)
+    parser.add_argument("--vehicles", type=int, default=200)
+    parser.add_argument("--snapshots", type=int, default=5, help="GTFS-RT polls fed through fetch_and_process.")
+    parser.add_argument("--days", type=int, default=1, help="Days of ping history bulk-loaded before timing.")
+    parser.add_argument("--permits", type=int, default=400)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write JSON results here (default: stdout).")
+    args = parser.parse_args()
+
+    report = run(args)
+    if report is None:
+        print("❌ Benchmark aborted: no database connection.")
+        raise SystemExit(1)
+
+    payload = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(payload + "\n")
+        print(f"✅ Results written to {args.output}")
+    else:
+        print(payload)
@@ -0,0 +1,249 @@
+import argparse
+import csv
+import io
+import json
+import math
+import os
+import random
+import time
+import uuid
+import zipfile
+
+# Downtown Hamilton (King & James)
+CENTER_LAT = 43.2557
+CENTER_LON = -79.8711
+
+# Roughly 100m between shape points at this latitude
+STEP_DEG = 0.001
+
+# The four layers the disruption views understand
+PERMIT_LAYERS = ["Closures", "Occupancy", "Utility_Consent", "Capital_Projects"]
+
+class HamiltonNetwork:
+    """
+    A deterministic, Hamilton-sized fake transit network.
+    Every generator below draws from the same seeded network so permits land
+    on real route shapes and vehicles drive along them.
+    """
+
+    def __init__(self, routes=35, trips_per_route=100, shape_points=250, seed=42):
+        self.rng = random.Random(seed)
+        self.routes = []
+        self.shapes = {}
+
+        for r in range(routes):
+            route_id = str(r + 1)
+            # Each route is a gently curving line through the city centre
+            heading = self.rng.uniform(0, math.pi)
+            start_lat = CENTER_LAT - math.sin(heading) * STEP_DEG * shape_points / 2 + self.rng.uniform(-0.02, 0.02)
+            start_lon = CENTER_LON - math.cos(heading) * STEP_DEG * shape_points / 2 + self.rng.uniform(-0.03, 0.03)
+
+            points = []
+            lat, lon = start_lat, start_lon
+            for _ in range(shape_points):
+                heading += self.rng.uniform(-0.05, 0.05)
+                lat += math.sin(heading) * STEP_DEG
+                lon += math.cos(heading) * STEP_DEG
+                points.append((round(lat, 6), round(lon, 6)))
+
+            self.shapes[f"{route_id}_0"] = points
+            self.shapes[f"{route_id}_1"] = list(reversed(points))
+            self.routes.append(route_id)
+
+        self.trips = []
+        for route_id in self.routes:
+            for t in range(trips_per_route):
+                direction = t % 2
+                self.trips.append((route_id, f"{route_id}_{t}", f"{route_id}_{direction}", direction))
+
+    def random_point(self):
+        shape = self.shapes[self.rng.choice(list(self.shapes))]
+        return self.rng.choice(shape)
+
+def gtfs_static_zip(network, stop_every=4):
+    """Returns google_transit.zip bytes with the files ingest_static reads."""
+    def to_csv(header, rows):
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(header)
+        writer.writerows(rows)
+        return buf.getvalue()
+
+    routes = [
+        (route_id, route_id, f"SYNTHETIC {route_id}", 3, "0077C0", "FFFFFF")
+        for route_id in network.routes
+    ]
+
+    stops = []
+    for shape_id, points in network.shapes.items():
+        if not shape_id.endswith("_0"):
+            continue
+        for i, (lat, lon) in enumerate(points[::stop_every]):
+            stop_id = f"{shape_id}_{i}"
+            stops.append((stop_id, stop_id, f"Stop {stop_id}", lat, lon))
+
+    trips = [
+        (route_id, "WEEKDAY", trip_id, f"Route {route_id}", shape_id, direction)
+        for route_id, trip_id, shape_id, direction in network.trips
+    ]
+
+    shapes = [
+        (shape_id, lat, lon, seq)
+        for shape_id, points in network.shapes.items()
+        for seq, (lat, lon) in enumerate(points)
+    ]
+
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr("routes.txt", to_csv(
+            ["route_id", "route_short_name", "route_long_name", "route_type", "route_color", "route_text_color"], routes))
+        z.writestr("stops.txt", to_csv(
+            ["stop_id", "stop_code", "stop_name", "stop_lat", "stop_lon"], stops))
+        z.writestr("trips.txt", to_csv(
+            ["route_id", "service_id", "trip_id", "trip_headsign", "shape_id", "direction_id"], trips))
+        z.writestr("shapes.txt", to_csv(
+            ["shape_id", "shape_pt_lat", "shape_pt_lon", "shape_pt_sequence"], shapes))
+    return buf.getvalue()
+
+def _permit_attributes(layer, n, rng, start_ms, end_ms):
+    guid = str(uuid.UUID(int=rng.getrandbits(128), version=4))
+    status = rng.choice(["Active", "Authorised"])
+    common = {
+        "OBJECTID": n,
+        # Unique across layers so the live_permits upsert never collides
+        "Permit_Number": f"{layer}-{n}",
+        "Status": status,
+        "Start_Date": start_ms,
+        "End_Date": end_ms,
+    }
+    if layer == "Closures":
+        return {**common, "globalid": guid, "closure_to_what_street_name": f"Street {n}",
+                "Close_Both_Traffic_Directions": rng.choice(["Yes", "No"]),
+                "Description": f"Synthetic closure {n}",
+                "Start_Date_of_Closure": start_ms, "End_Date_of_Closure": end_ms}
+    if layer == "Occupancy":
+        return {**common, "globalid": guid, "Occupancy_Number": f"OCC-{n}",
+                "Item_for_Occupancy": rng.choice(["Crane", "Bin", "Hoarding", "Scaffold"]),
+                "Location": f"{n} Main St", "LRT": rng.choice(["Yes", "No"]),
+                "Start_Date_of_Occupancy": start_ms, "End_Date_of_Occupancy": end_ms}
+    if layer == "Utility_Consent":
+        return {**common, "GlobalID": guid, "MC_Permit_Number": f"MC-{n}",
+                "Utility_Company_Name": rng.choice(["Alectra", "Enbridge", "Bell", "Rogers"]),
+                "Project_Name": f"Utility project {n}", "Stream_Class": rng.choice(["Minor", "Major"]),
+                "Date_Approved": start_ms, "Date_Expired": end_ms}
+    return {**common, "globalid": guid, "GeomaticsJobID": f"GJ-{n}",
+            "Project_Name": f"Capital project {n}",
+            "Date_Submitted": start_ms, "Date_Requested_Completion": end_ms}
+
+def arcgis_permits(network, permits=400, size_deg=0.0004):
+    """
+    Returns {layer: ArcGIS FeatureServer query JSON}.
+    Each permit is a small square work zone centred on a route shape point.
+    """
+    rng = network.rng
+    now_ms = int(time.time() * 1000)
+    day_ms = 86400 * 1000
+    layers = {layer: [] for layer in PERMIT_LAYERS}
+
+    for n in range(permits):
+        layer = PERMIT_LAYERS[n % len(PERMIT_LAYERS)]
+        lat, lon = network.random_point()
+        half = size_deg / 2
+        ring = [[lon - half, lat - half], [lon + half, lat - half], [lon + half, lat + half],
+                [lon - half, lat + half], [lon - half, lat - half]]
+        # A slice of permits has already expired, like the real feed
+        start_ms = now_ms - rng.randint(1, 60) * day_ms
+        end_ms = now_ms + rng.randint(-10, 90) * day_ms
+        layers[layer].append({
+            "attributes": _permit_attributes(layer, n, rng, start_ms, end_ms),
+            "geometry": {"rings": [ring]},
+        })
+
+    return {layer: {"features": features} for layer, features in layers.items()}
+
+def gtfs_realtime_feeds(network, vehicles=200, snapshots=5, interval=30):
+    """
+    Returns a list of serialized VehiclePositions FeedMessages, one per poll,
+    with each vehicle advancing along its trip's shape between snapshots.
+    Stamped so the last poll is "now": generate right before ingesting, or the
+    pings fall outside the diagnostic's freshness window.
+    """
+    from google.transit import gtfs_realtime_pb2
+
+    rng = network.rng
+    fleet = []
+    for v in range(vehicles):
+        route_id, trip_id, shape_id, _ = rng.choice(network.trips)
+        fleet.append((f"BUS-{v}", route_id, trip_id, network.shapes[shape_id], rng.randrange(len(network.shapes[shape_id]))))
+
+    now = int(time.time()) - (snapshots - 1) * interval
+    feeds = []
+    for snap in range(snapshots):
+        ts = now + snap * interval
+        feed = gtfs_realtime_pb2.FeedMessage()
+        feed.header.gtfs_realtime_version = "2.0"
+        feed.header.timestamp = ts
+
+        for vehicle_id, route_id, trip_id, points, offset in fleet:
+            i = (offset + snap) % len(points)
+            lat, lon = points[i]
+            next_lat, next_lon = points[(i + 1) % len(points)]
+
+            entity = feed.entity.add()
+            entity.id = vehicle_id
+            v = entity.vehicle
+            v.vehicle.id = vehicle_id
+            v.trip.trip_id = trip_id
+            v.trip.route_id = route_id
+            v.position.latitude = lat
+            v.position.longitude = lon
+            v.position.bearing = math.degrees(math.atan2(next_lon - lon, next_lat - lat)) % 360
+            v.position.speed = rng.uniform(0, 15)
+            v.timestamp = ts
+
+        feeds.append(feed.SerializeToString())
+    return feeds
+
+def write_realtime(out_dir, network, vehicles=200, snapshots=5):
+    """Writes realtime/<n>.pb, stamped at call time (see gtfs_realtime_feeds)."""
+    os.makedirs(os.path.join(out_dir, "realtime"), exist_ok=True)
+    for n, payload in enumerate(gtfs_realtime_feeds(network, vehicles=vehicles, snapshots=snapshots)):
+        with open(os.path.join(out_dir, "realtime", f"{n}.pb"), "wb") as f:
+            f.write(payload)
+
+def write_dataset(out_dir, routes=35, trips_per_route=100, vehicles=200, snapshots=5, permits=400, seed=42, realtime=True):
+    """
+    Writes the full synthetic dataset in the layout the benchmark serves over HTTP:
+        google_transit.zip, permits/<layer>.json, realtime/<n>.pb
+    With realtime=False the feeds are left for a later write_realtime on the returned network.
+    """
+    network = HamiltonNetwork(routes=routes, trips_per_route=trips_per_route, seed=seed)
+
+    with open(os.path.join(out_dir, "google_transit.zip"), "wb") as f:
+        f.write(gtfs_static_zip(network))
+
+    os.makedirs(os.path.join(out_dir, "permits"), exist_ok=True)
+    for layer, payload in arcgis_permits(network, permits=permits).items():
+        with open(os.path.join(out_dir, "permits", f"{layer}.json"), "w") as f:
+            json.dump(payload, f)
+
+    if realtime:
+        write_realtime(out_dir, network, vehicles=vehicles, snapshots=snapshots)
+
+    return network
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic Hamilton-scale GTFS / permit / GTFS-RT dataset.")
+    parser.add_argument("out_dir")
+    parser.add_argument("--routes", type=int, default=35)
+    parser.add_argument("--trips-per-route", type=int, default=100)
+    parser.add_argument("--vehicles", type=int, default=200)
+    parser.add_argument("--snapshots", type=int, default=5)
+    parser.add_argument("--permits", type=int, default=400)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    write_dataset(args.out_dir, routes=args.routes, trips_per_route=args.trips_per_route,
+                  vehicles=args.vehicles, snapshots=args.snapshots, permits=args.permits, seed=args.seed)
+    print(f"✅ Synthetic dataset written to {args.out_dir}")
@@ -33,10 +33,100 @@ CREATE EXTENSION IF NOT EXISTS postgis WITH SCHEMA public;
 COMMENT ON EXTENSION postgis IS 'PostGIS geometry and geography spatial types and functions';
 
 
+--
+-- Name: epoch_ms_to_timestamptz(text); Type: FUNCTION; Schema: public; Owner: kashy
+--
+
+CREATE FUNCTION public.epoch_ms_to_timestamptz(ms text) RETURNS timestamp with time zone
+    LANGUAGE sql IMMUTABLE
+    AS $$
+    SELECT CASE WHEN ms ~ '^-?\d{1,13}$' THEN to_timestamp(ms::bigint / 1000.0) END;
+$$;
+
+
+ALTER FUNCTION public.epoch_ms_to_timestamptz(ms text) OWNER TO kashy;
+
+--
+-- Name: refresh_disruption(); Type: FUNCTION; Schema: public; Owner: kashy
+--
+
+CREATE FUNCTION public.refresh_disruption() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        DELETE FROM disruptions WHERE permit_id = OLD.permit_id;
+        RETURN OLD;
+    END IF;
+    PERFORM upsert_disruption(NEW);
+    RETURN NEW;
+END;
+$$;
+
+
+ALTER FUNCTION public.refresh_disruption() OWNER TO kashy;
+
 SET default_tablespace = '';
 
 SET default_table_access_method = heap;
 
+--
+-- Name: conflict_events; Type: TABLE; Schema: public; Owner: kashy
+--
+
+CREATE TABLE public.conflict_events (
+    id bigint NOT NULL,
+    conflict_type character varying(20),
+    target_id text,
+    description text,
+    metric character varying(50),
+    first_seen timestamp with time zone DEFAULT now(),
+    closed_at timestamp with time zone,
+    geom public.geometry(Geometry,4326)
+);
+
+
+ALTER TABLE public.conflict_events OWNER TO kashy;
+
+--
+-- Name: conflict_events_id_seq; Type: SEQUENCE; Schema: public; Owner: kashy
+--
+
+CREATE SEQUENCE public.conflict_events_id_seq
+    START WITH 1
+    INCREMENT BY 1
+    NO MINVALUE
+    NO MAXVALUE
+    CACHE 1;
+
+
+ALTER SEQUENCE public.conflict_events_id_seq OWNER TO kashy;
+
+--
+-- Name: conflict_events_id_seq; Type: SEQUENCE OWNED BY; Schema: public; Owner: kashy
+--
+
+ALTER SEQUENCE public.conflict_events_id_seq OWNED BY public.conflict_events.id;
+
+
+--
+-- Name: disruptions; Type: TABLE; Schema: public; Owner: kashy
+--
+
+CREATE TABLE public.disruptions (
+    permit_id character varying(100) NOT NULL,
+    source_layer character varying(50),
+    disruption_type character varying(50),
+    status character varying(50),
+    description text,
+    validity tstzrange,
+    active boolean,
+    geom public.geometry(Geometry,4326)
+);
+
+
+ALTER TABLE public.disruptions OWNER TO kashy;
+
 --
 -- Name: live_permits; Type: TABLE; Schema: public; Owner: kashy
 --
@@ -56,6 +146,70 @@ CREATE TABLE public.live_permits (
 
 ALTER TABLE public.live_permits OWNER TO kashy;
 
+--
+-- Name: upsert_disruption(public.live_permits); Type: FUNCTION; Schema: public; Owner: kashy
+--
+
+CREATE FUNCTION public.upsert_disruption(p public.live_permits) RETURNS void
+    LANGUAGE plpgsql
+    AS $$
+DECLARE
+    f JSONB := p.metadata -> 'original_fields';
+    d_type TEXT;
+    d_desc TEXT;
+    d_start TIMESTAMPTZ := p.start_time;
+    d_end TIMESTAMPTZ := p.end_time;
+BEGIN
+    -- Per-layer field mapping (formerly the vw_* views); other layers keep their hazard_type
+    CASE p.source_layer
+        WHEN 'Closures' THEN
+            d_type := 'CLOSURE';
+            d_desc := f ->> 'Description';
+            d_start := COALESCE(d_start, epoch_ms_to_timestamptz(f ->> 'Start_Date_of_Closure'));
+            d_end := COALESCE(d_end, epoch_ms_to_timestamptz(f ->> 'End_Date_of_Closure'));
+        WHEN 'Capital_Projects' THEN
+            d_type := 'CONSTRUCTION';
+            d_desc := f ->> 'Project_Name';
+            d_start := COALESCE(d_start, epoch_ms_to_timestamptz(f ->> 'Date_Submitted'));
+            d_end := COALESCE(d_end, epoch_ms_to_timestamptz(f ->> 'Date_Requested_Completion'));
+        WHEN 'Utility_Consent' THEN
+            d_type := 'UTILITY_WORK';
+            d_desc := f ->> 'Utility_Company_Name';
+            d_start := COALESCE(d_start, epoch_ms_to_timestamptz(f ->> 'Date_Approved'));
+            d_end := COALESCE(d_end, epoch_ms_to_timestamptz(f ->> 'Date_Expired'));
+        WHEN 'Occupancy' THEN
+            d_type := 'OCCUPANCY';
+            d_desc := f ->> 'Item_for_Occupancy';
+        ELSE
+            d_type := p.hazard_type;
+    END CASE;
+
+    -- Bad city data (end before start) would make tstzrange() raise
+    IF d_start > d_end THEN
+        d_start := d_end;
+    END IF;
+
+    -- A missing or malformed end date is open-ended, like the range itself
+    INSERT INTO disruptions (permit_id, source_layer, disruption_type, status, description, validity, active, geom)
+    VALUES (
+        p.permit_id, p.source_layer, d_type, LEFT(p.metadata ->> 'status', 50),
+        COALESCE(d_desc, p.description), tstzrange(d_start, d_end),
+        d_end IS NULL OR d_end > NOW(), p.geom
+    )
+    ON CONFLICT (permit_id) DO UPDATE SET
+        source_layer = EXCLUDED.source_layer,
+        disruption_type = EXCLUDED.disruption_type,
+        status = EXCLUDED.status,
+        description = EXCLUDED.description,
+        validity = EXCLUDED.validity,
+        active = EXCLUDED.active,
+        geom = EXCLUDED.geom;
+END;
+$$;
+
+
+ALTER FUNCTION public.upsert_disruption(p public.live_permits) OWNER TO kashy;
+
 --
 -- Name: live_permits_id_seq; Type: SEQUENCE; Schema: public; Owner: kashy
 --
@@ -231,150 +385,57 @@ CREATE TABLE public.trips (
 ALTER TABLE public.trips OWNER TO kashy;
 
 --
--- Name: vw_capital_projects; Type: VIEW; Schema: public; Owner: kashy
+-- Name: vw_all_disruptions; Type: VIEW; Schema: public; Owner: kashy
 --
 
-CREATE VIEW public.vw_capital_projects AS
- SELECT (((metadata -> 'original_fields'::text) ->> 'globalid'::text))::uuid AS id,
-    ((metadata -> 'original_fields'::text) ->> 'GeomaticsJobID'::text) AS job_number,
-    ((metadata -> 'original_fields'::text) ->> 'Project_Name'::text) AS project_name,
-    ((metadata -> 'original_fields'::text) ->> 'Project_Description'::text) AS description,
-    ((metadata -> 'original_fields'::text) ->> 'Status'::text) AS status,
-    ((metadata -> 'original_fields'::text) ->> 'Subtype'::text) AS work_type,
-    ((metadata -> 'original_fields'::text) ->> 'Client_Department'::text) AS department,
-    to_timestamp(((((((metadata -> 'original_fields'::text) ->> 'Date_Submitted'::text))::bigint)::numeric / 1000.0))::double precision) AS date_submitted,
-    to_timestamp(((((((metadata -> 'original_fields'::text) ->> 'Date_Requested_Completion'::text))::bigint)::numeric / 1000.0))::double precision) AS estimated_completion,
+CREATE VIEW public.vw_all_disruptions AS
+ SELECT permit_id AS id,
+    disruption_type,
+    status,
+    description,
+    lower(validity) AS start_time,
+    upper(validity) AS end_time,
     geom
-   FROM public.live_permits
-  WHERE (((source_layer)::text = 'Capital_Projects'::text) AND (((metadata -> 'original_fields'::text) ->> 'GeomaticsJobID'::text) IS NOT NULL));
+   FROM public.disruptions;
 
 
-ALTER VIEW public.vw_capital_projects OWNER TO kashy;
+ALTER VIEW public.vw_all_disruptions OWNER TO kashy;
 
 --
--- Name: vw_occupancy_permits; Type: VIEW; Schema: public; Owner: kashy
+-- Name: conflict_events id; Type: DEFAULT; Schema: public; Owner: kashy
 --
 
-CREATE VIEW public.vw_occupancy_permits AS
- SELECT (((metadata -> 'original_fields'::text) ->> 'globalid'::text))::uuid AS id,
-    ((metadata -> 'original_fields'::text) ->> 'Occupancy_Number'::text) AS permit_number,
-    ((metadata -> 'original_fields'::text) ->> 'Item_for_Occupancy'::text) AS obstruction_type,
-    ((metadata -> 'original_fields'::text) ->> 'Location'::text) AS address,
-    ((metadata -> 'original_fields'::text) ->> 'Status'::text) AS status,
-    ((metadata -> 'original_fields'::text) ->> 'LRT'::text) AS affects_lrt,
-    to_timestamp(((((((metadata -> 'original_fields'::text) ->> 'Start_Date_of_Occupancy'::text))::bigint)::numeric / 1000.0))::double precision) AS start_date,
-    to_timestamp(((((((metadata -> 'original_fields'::text) ->> 'End_Date_of_Occupancy'::text))::bigint)::numeric / 1000.0))::double precision) AS end_date,
-    geom
-   FROM public.live_permits
-  WHERE (((source_layer)::text = 'Occupancy'::text) AND (((metadata -> 'original_fields'::text) ->> 'globalid'::text) IS NOT NULL));
+ALTER TABLE ONLY public.conflict_events ALTER COLUMN id SET DEFAULT nextval('public.conflict_events_id_seq'::regclass);
 
 
-ALTER VIEW public.vw_occupancy_permits OWNER TO kashy;
-
---
--- Name: vw_road_closures; Type: VIEW; Schema: public; Owner: kashy
 --
-
-CREATE VIEW public.vw_road_closures AS
- SELECT (((metadata -> 'original_fields'::text) ->> 'globalid'::text))::uuid AS id,
-    ((metadata -> 'original_fields'::text) ->> 'Permit_Number'::text) AS permit_number,
-    ((metadata -> 'original_fields'::text) ->> 'closure_to_what_street_name'::text) AS road_name,
-    ((metadata -> 'original_fields'::text) ->> 'from_what_cross_street'::text) AS from_street,
-    ((metadata -> 'original_fields'::text) ->> 'to_what_cross_street'::text) AS to_street,
-    ((metadata -> 'original_fields'::text) ->> 'Project_Name'::text) AS title,
-    ((metadata -> 'original_fields'::text) ->> 'Description'::text) AS description,
-    ((metadata -> 'original_fields'::text) ->> 'Type_of_Use'::text) AS reason,
-    ((metadata -> 'original_fields'::text) ->> 'Close_Both_Traffic_Directions'::text) AS closure_type,
-    ((metadata -> 'original_fields'::text) ->> 'Status'::text) AS status,
-    to_timestamp(((((((metadata -> 'original_fields'::text) ->> 'Start_Date_of_Closure'::text))::bigint)::numeric / 1000.0))::double precision) AS start_date,
-    to_timestamp(((((((metadata -> 'original_fields'::text) ->> 'End_Date_of_Closure'::text))::bigint)::numeric / 1000.0))::double precision) AS end_date,
-    ((metadata -> 'original_fields'::text) ->> 'Start_Time'::text) AS daily_start_time,
-    ((metadata -> 'original_fields'::text) ->> 'End_Time'::text) AS daily_end_time,
-    geom
-   FROM public.live_permits
-  WHERE (((source_layer)::text = 'Closures'::text) AND (((metadata -> 'original_fields'::text) ->> 'globalid'::text) IS NOT NULL));
-
-
-ALTER VIEW public.vw_road_closures OWNER TO kashy;
-
---
--- Name: vw_utility_permits; Type: VIEW; Schema: public; Owner: kashy
+-- Name: live_permits id; Type: DEFAULT; Schema: public; Owner: kashy
 --
 
-CREATE VIEW public.vw_utility_permits AS
- SELECT (((metadata -> 'original_fields'::text) ->> 'GlobalID'::text))::uuid AS id,
-    ((metadata -> 'original_fields'::text) ->> 'MC_Permit_Number'::text) AS permit_number,
-    ((metadata -> 'original_fields'::text) ->> 'Road_Cut_Permit_EP'::text) AS road_cut_id,
-    ((metadata -> 'original_fields'::text) ->> 'Utility_Company_Name'::text) AS company_name,
-    ((metadata -> 'original_fields'::text) ->> 'Project_Name'::text) AS project_name,
-    ((metadata -> 'original_fields'::text) ->> 'Status'::text) AS status,
-    ((metadata -> 'original_fields'::text) ->> 'Stream_Class'::text) AS impact_level,
-    (((metadata -> 'original_fields'::text) ->> 'Underground_Linear_Length_m'::text))::numeric AS length_m,
-    to_timestamp(((((((metadata -> 'original_fields'::text) ->> 'Date_Approved'::text))::bigint)::numeric / 1000.0))::double precision) AS date_approved,
-    to_timestamp(((((((metadata -> 'original_fields'::text) ->> 'Date_Expired'::text))::bigint)::numeric / 1000.0))::double precision) AS date_expired,
-    geom
-   FROM public.live_permits
-  WHERE (((source_layer)::text = 'Utility_Consent'::text) AND (((metadata -> 'original_fields'::text) ->> 'GlobalID'::text) IS NOT NULL));
-
+ALTER TABLE ONLY public.live_permits ALTER COLUMN id SET DEFAULT nextval('public.live_permits_id_seq'::regclass);
 
-ALTER VIEW public.vw_utility_permits OWNER TO kashy;
 
 --
--- Name: vw_all_disruptions; Type: VIEW; Schema: public; Owner: kashy
+-- Name: live_vehicle_positions id; Type: DEFAULT; Schema: public; Owner: kashy
 --
 
-CREATE VIEW public.vw_all_disruptions AS
- SELECT vw_road_closures.id,
-    'CLOSURE'::text AS disruption_type,
-    vw_road_closures.status,
-    (((vw_road_closures.road_name || ' ('::text) || vw_road_closures.closure_type) || ')'::text) AS description,
-    vw_road_closures.start_date AS start_time,
-    vw_road_closures.end_date AS end_time,
-    vw_road_closures.geom
-   FROM public.vw_road_closures
-UNION ALL
- SELECT vw_capital_projects.id,
-    'CONSTRUCTION'::text AS disruption_type,
-    vw_capital_projects.status,
-    vw_capital_projects.project_name AS description,
-    vw_capital_projects.date_submitted AS start_time,
-    vw_capital_projects.estimated_completion AS end_time,
-    vw_capital_projects.geom
-   FROM public.vw_capital_projects
-UNION ALL
- SELECT vw_utility_permits.id,
-    'UTILITY_WORK'::text AS disruption_type,
-    vw_utility_permits.status,
-    (((vw_utility_permits.company_name || ' ('::text) || vw_utility_permits.impact_level) || ')'::text) AS description,
-    vw_utility_permits.date_approved AS start_time,
-    vw_utility_permits.date_expired AS end_time,
-    vw_utility_permits.geom
-   FROM public.vw_utility_permits
-UNION ALL
- SELECT vw_occupancy_permits.id,
-    'OCCUPANCY'::text AS disruption_type,
-    vw_occupancy_permits.status,
-    ((vw_occupancy_permits.obstruction_type || ' at '::text) || vw_occupancy_permits.address) AS description,
-    vw_occupancy_permits.start_date AS start_time,
-    vw_occupancy_permits.end_date AS end_time,
-    vw_occupancy_permits.geom
-   FROM public.vw_occupancy_permits;
-
+ALTER TABLE ONLY public.live_vehicle_positions ALTER COLUMN id SET DEFAULT nextval('public.live_vehicle_positions_id_seq'::regclass);
 
-ALTER VIEW public.vw_all_disruptions OWNER TO kashy;
 
 --
--- Name: live_permits id; Type: DEFAULT; Schema: public; Owner: kashy
+-- Name: conflict_events conflict_events_pkey; Type: CONSTRAINT; Schema: public; Owner: kashy
 --
 
-ALTER TABLE ONLY public.live_permits ALTER COLUMN id SET DEFAULT nextval('public.live_permits_id_seq'::regclass);
+ALTER TABLE ONLY public.conflict_events
+    ADD CONSTRAINT conflict_events_pkey PRIMARY KEY (id);
 
 
 --
--- Name: live_vehicle_positions id; Type: DEFAULT; Schema: public; Owner: kashy
+-- Name: disruptions disruptions_pkey; Type: CONSTRAINT; Schema: public; Owner: kashy
 --
 
-ALTER TABLE ONLY public.live_vehicle_positions ALTER COLUMN id SET DEFAULT nextval('public.live_vehicle_positions_id_seq'::regclass);
+ALTER TABLE ONLY public.disruptions
+    ADD CONSTRAINT disruptions_pkey PRIMARY KEY (permit_id);
 
 
 --
@@ -425,6 +486,48 @@ ALTER TABLE ONLY public.trips
     ADD CONSTRAINT trips_pkey PRIMARY KEY (trip_id);
 
 
+--
+-- Name: idx_conflict_events_closed; Type: INDEX; Schema: public; Owner: kashy
+--
+
+CREATE INDEX idx_conflict_events_closed ON public.conflict_events USING btree (closed_at) WHERE (closed_at IS NOT NULL);
+
+
+--
+-- Name: idx_conflict_events_geom; Type: INDEX; Schema: public; Owner: kashy
+--
+
+CREATE INDEX idx_conflict_events_geom ON public.conflict_events USING gist (geom);
+
+
+--
+-- Name: idx_conflict_events_open; Type: INDEX; Schema: public; Owner: kashy
+--
+
+CREATE INDEX idx_conflict_events_open ON public.conflict_events USING btree (conflict_type, target_id) WHERE (closed_at IS NULL);
+
+
+--
+-- Name: idx_conflict_events_open_key; Type: INDEX; Schema: public; Owner: kashy
+--
+
+CREATE UNIQUE INDEX idx_conflict_events_open_key ON public.conflict_events USING btree (conflict_type, target_id, md5(COALESCE(description, ''::text)), md5(public.st_asewkb(geom))) WHERE (closed_at IS NULL);
+
+
+--
+-- Name: idx_disruptions_active_geom; Type: INDEX; Schema: public; Owner: kashy
+--
+
+CREATE INDEX idx_disruptions_active_geom ON public.disruptions USING gist (geom) WHERE active;
+
+
+--
+-- Name: idx_disruptions_validity; Type: INDEX; Schema: public; Owner: kashy
+--
+
+CREATE INDEX idx_disruptions_validity ON public.disruptions USING gist (validity);
+
+
 --
 -- Name: idx_live_permits_geom; Type: INDEX; Schema: public; Owner: kashy
 --
@@ -474,6 +577,27 @@ CREATE INDEX idx_vehicle_pos_geom ON public.live_vehicle_positions USING gist (g
 CREATE INDEX idx_vehicle_pos_time ON public.live_vehicle_positions USING btree ("timestamp");
 
 
+--
+-- Name: idx_vehicle_pos_unique; Type: INDEX; Schema: public; Owner: kashy
+--
+
+CREATE UNIQUE INDEX idx_vehicle_pos_unique ON public.live_vehicle_positions USING btree (vehicle_id, "timestamp");
+
+
+--
+-- Name: live_permits trg_disruptions_insert_delete; Type: TRIGGER; Schema: public; Owner: kashy
+--
+
+CREATE TRIGGER trg_disruptions_insert_delete AFTER INSERT OR DELETE ON public.live_permits FOR EACH ROW EXECUTE FUNCTION public.refresh_disruption();
+
+
+--
+-- Name: live_permits trg_disruptions_update; Type: TRIGGER; Schema: public; Owner: kashy
+--
+
+CREATE TRIGGER trg_disruptions_update AFTER UPDATE ON public.live_permits FOR EACH ROW WHEN ((old.* IS DISTINCT FROM new.*)) EXECUTE FUNCTION public.refresh_disruption();
+
+
 --
 -- PostgreSQL database dump complete
 --
@@ -0,0 +1,221 @@
+import datetime
+import os
+from engine.settings import get_db_connection
+from engine.instrumentation import stage, export_textfile
+
+# Layout: <archive_dir>/<dataset>/date=YYYY-MM-DD/ (UTC days) holding
+#   snapshot.parquet - copy of rows that are still in Postgres (plain runs)
+#   part-N.parquet   - rows exported and deleted in the same transaction (--prune runs)
+# A row is in at most one file, so reading date=*/*.parquet never double counts.
+ARCHIVE_DIR = "archive/history"
+SNAPSHOT_FILE = "snapshot.parquet"
+BATCH_ROWS = 100_000
+
+# dataset -> (SQL for one closed day, columns, arrow type names)
+# Low-cardinality ids are dictionary-encoded; geometry is kept as WKB for the events only,
+# pings already carry latitude/longitude.
+DATASETS = {
+    "vehicle_positions": (
+        """
+        SELECT vehicle_id, trip_id, route_id, latitude, longitude, bearing, speed, timestamp
+        FROM live_vehicle_positions
+        WHERE timestamp >= %(start)s AND timestamp < %(end)s
+        ORDER BY timestamp
+        """,
+        [
+            ("vehicle_id", "dictionary"), ("trip_id", "dictionary"), ("route_id", "dictionary"),
+            ("latitude", "float64"), ("longitude", "float64"),
+            ("bearing", "float32"), ("speed", "float32"),
+            ("timestamp", "timestamp"),
+        ],
+    ),
+    "conflict_events": (
+        """
+        SELECT id, conflict_type, target_id, description, metric, first_seen, closed_at, ST_AsBinary(geom)
+        FROM conflict_events
+        WHERE closed_at >= %(start)s AND closed_at < %(end)s
+        ORDER BY closed_at
+        """,
+        [
+            ("id", "int64"), ("conflict_type", "dictionary"), ("target_id", "dictionary"),
+            ("description", "dictionary"), ("metric", "string"),
+            ("first_seen", "timestamp"), ("closed_at", "timestamp"), ("geom_wkb", "binary"),
+        ],
+    ),
+}
+
+# Rows that are safe to delete once archived (open conflicts are never pruned)
+PRUNE_SQL = {
+    "vehicle_positions": "DELETE FROM live_vehicle_positions WHERE timestamp >= %(start)s AND timestamp < %(end)s;",
+    "conflict_events": "DELETE FROM conflict_events WHERE closed_at >= %(start)s AND closed_at < %(end)s;",
+}
+
+# Oldest row per dataset, via idx_vehicle_pos_time / idx_conflict_events_closed
+OLDEST_SQL = {
+    "vehicle_positions": "SELECT MIN(timestamp) FROM live_vehicle_positions;",
+    "conflict_events": "SELECT MIN(closed_at) FROM conflict_events;",
+}
+
+# Whether a closed day still has rows in Postgres, same indexes
+EXISTS_SQL = {
+    "vehicle_positions": "SELECT EXISTS (SELECT 1 FROM live_vehicle_positions WHERE timestamp >= %(start)s AND timestamp < %(end)s);",
+    "conflict_events": "SELECT EXISTS (SELECT 1 FROM conflict_events WHERE closed_at >= %(start)s AND closed_at < %(end)s);",
+}
+
+def arrow_schema(columns):
+    import pyarrow as pa
+
+    types = {
+        "dictionary": pa.dictionary(pa.int32(), pa.string()),
+        "string": pa.string(),
+        "float64": pa.float64(),
+        "float32": pa.float32(),
+        "int64": pa.int64(),
+        "timestamp": pa.timestamp("us", tz="UTC"),
+        "binary": pa.binary(),
+    }
+    return pa.schema([(name, types[kind]) for name, kind in columns])
+
+def partition_dir(archive_dir, dataset, day):
+    return os.path.join(archive_dir, dataset, f"date={day.isoformat()}")
+
+def next_part_path(archive_dir, dataset, day):
+    directory = partition_dir(archive_dir, dataset, day)
+    parts = [n for n in os.listdir(directory) if n.startswith("part-") and n.endswith(".parquet")] if os.path.isdir(directory) else []
+    return os.path.join(directory, f"part-{len(parts)}.parquet")
+
+def day_bounds(day):
+    start = datetime.datetime.combine(day, datetime.time(), tzinfo=datetime.timezone.utc)
+    return {"start": start, "end": start + datetime.timedelta(days=1)}
+
+def export_day(conn, dataset, day, path):
+    """
+    Streams one closed UTC day of a dataset into a zstd-compressed Parquet file.
+    Written to a temp file and renamed, so a file either exists whole or not at all.
+    Returns the number of rows written.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sql, columns = DATASETS[dataset]
+    schema = arrow_schema(columns)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+
+    # Named (server-side) cursor: a day of pings never has to fit in memory
+    cur = conn.cursor(name=f"archive_{dataset}")
+    cur.itersize = BATCH_ROWS
+    cur.execute(sql, day_bounds(day))
+
+    rows = 0
+    with pq.ParquetWriter(tmp_path, schema, compression="zstd", use_dictionary=True) as writer:
+        while True:
+            batch = cur.fetchmany(BATCH_ROWS)
+            if not batch:
+                break
+            arrays = []
+            for values, field in zip(zip(*batch), schema):
+                if pa.types.is_dictionary(field.type):
+                    arrays.append(pa.array(values, type=pa.string()).dictionary_encode())
+                else:
+                    arrays.append(pa.array(values, type=field.type))
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            rows += len(batch)
+    cur.close()
+
+    os.replace(tmp_path, path)
+    return rows
+
+def closed_days(conn, dataset, archive_dir=ARCHIVE_DIR, prune=False):
+    """
+    Days before today (UTC) to archive. Without prune: days with data and no partition yet.
+    With prune: every day that still has rows in Postgres, including days already exported
+    (rows replayed or backfilled after the export, or left by a failed prune).
+    """
+    cur = conn.cursor()
+    cur.execute(OLDEST_SQL[dataset])
+    oldest = cur.fetchone()[0]
+    if oldest is None:
+        cur.close()
+        return []
+
+    today = datetime.datetime.now(datetime.timezone.utc).date()
+    day = oldest.astimezone(datetime.timezone.utc).date()
+    days = []
+    while day < today:
+        # Without prune, an existing partition already covers the day
+        if prune or not os.path.isdir(partition_dir(archive_dir, dataset, day)):
+            cur.execute(EXISTS_SQL[dataset], day_bounds(day))
+            if cur.fetchone()[0]:
+                days.append(day)
+        day += datetime.timedelta(days=1)
+    cur.close()
+    return days
+
+def prune_day(conn, dataset, day, archive_dir=ARCHIVE_DIR):
+    """
+    Moves one closed day from Postgres into a new part file.
+    Export and DELETE share one REPEATABLE READ snapshot, so exactly the exported rows
+    are deleted; rows committed meanwhile stay for the next run.
+    Returns (rows, path).
+    """
+    cur = conn.cursor()
+    cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ;")
+
+    path = next_part_path(archive_dir, dataset, day)
+    with stage("archive", "parquet_export"):
+        rows = export_day(conn, dataset, day, path)
+    try:
+        with stage("archive", "prune"):
+            cur.execute(PRUNE_SQL[dataset], day_bounds(day))
+        if cur.rowcount != rows:
+            raise RuntimeError(f"expected to prune {rows} rows, matched {cur.rowcount}")
+
+        # The part file now holds everything the snapshot did
+        snapshot = os.path.join(partition_dir(archive_dir, dataset, day), SNAPSHOT_FILE)
+        if os.path.exists(snapshot):
+            os.remove(snapshot)
+        conn.commit()
+    except Exception:
+        os.remove(path)
+        raise
+    finally:
+        cur.close()
+    return rows, path
+
+@stage("archive", "archive_history")
+def archive_history(archive_dir=ARCHIVE_DIR, prune=False):
+    """
+    Exports every closed day of each dataset.
+    Plain runs write a snapshot of days not archived yet and leave Postgres alone.
+    With prune=True each day still in Postgres is moved into a part file (see prune_day),
+    keeping live_vehicle_positions to the recent window.
+    """
+    conn = get_db_connection()
+    if not conn: return
+
+    for dataset in DATASETS:
+        days = closed_days(conn, dataset, archive_dir, prune)
+        conn.commit()
+        print(f"🗄️  {dataset}: {len(days)} closed day(s) to archive.")
+
+        for day in days:
+            try:
+                if prune:
+                    rows, path = prune_day(conn, dataset, day, archive_dir)
+                else:
+                    path = os.path.join(partition_dir(archive_dir, dataset, day), SNAPSHOT_FILE)
+                    with stage("archive", "parquet_export"):
+                        rows = export_day(conn, dataset, day, path)
+                    conn.commit()
+                print(f"   - {day}: {rows} rows -> {path}")
+            except Exception as e:
+                print(f"❌ Error archiving {dataset} for {day}: {e}")
+                conn.rollback()
+
+    conn.close()
+    print("✅ History archive up to date.")
+
+if __name__ == "__main__":
+    archive_history()
+    export_textfile("archive")
@@ -0,0 +1,118 @@
+import argparse
+import datetime
+import os
+import tempfile
+
+# Each handler imports its engine on demand, so `transitmind static` never
+# loads protobuf bindings and `transitmind realtime` never loads FastAPI.
+
+def run_static(args):
+    from engine.ingest_static import ingest_static
+    from engine.instrumentation import export_textfile
+    ingest_static()
+    export_textfile("static")
+
+def run_permits(args):
+    from engine.ingest_permits import ingest_layers
+    from engine.instrumentation import export_textfile
+    ingest_layers()
+    export_textfile("permits")
+
+def run_realtime(args):
+    from engine.ingest_realtime import run
+    run(args)
+
+def run_detect(args):
+    from engine.detect_conflicts import run_loop
+    run_loop()
+
+def run_archive(args):
+    from engine.archive_history import archive_history
+    from engine.instrumentation import export_textfile
+    archive_history(archive_dir=args.dir, prune=args.prune)
+    export_textfile("archive")
+
+def run_history(args):
+    from engine import history
+    if args.report == "routes":
+        rows = history.route_day_summary(args.dir, args.start_date, args.end_date, args.route)
+        history.print_table(["date", "route", "pings", "vehicles", "trips", "avg_speed", "stopped_%"], rows)
+    else:
+        rows = history.conflict_day_summary(args.dir, args.start_date, args.end_date)
+        history.print_table(["date", "type", "events", "targets", "avg_min_open"], rows)
+
+def prepare_metrics_dir():
+    """
+    Points prometheus_client at a shared, empty directory before the workers start,
+    so /metrics can merge every worker's histograms (see instrumentation.latest).
+    """
+    metrics_dir = os.environ.get("PROMETHEUS_MULTIPROC_DIR") or tempfile.mkdtemp(prefix="transitmind_metrics_")
+    os.makedirs(metrics_dir, exist_ok=True)
+    # Files left by a previous server would be merged into this one's metrics
+    for name in os.listdir(metrics_dir):
+        if name.endswith(".db"):
+            os.remove(os.path.join(metrics_dir, name))
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = metrics_dir
+    return metrics_dir
+
+def run_serve(args):
+    import uvicorn
+    if args.workers > 1:
+        print(f"📈 Multiprocess metrics in {prepare_metrics_dir()}")
+    uvicorn.run("web.api:app", host=args.host, port=args.port, workers=args.workers)
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="transitmind", description="TransitMind: Hamilton engine and API.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    static = sub.add_parser("static", help="Download and ingest the HSR GTFS static schedule.")
+    static.set_defaults(handler=run_static)
+
+    permits = sub.add_parser("permits", help="Ingest City of Hamilton ArcGIS permit layers.")
+    permits.set_defaults(handler=run_permits)
+
+    realtime = sub.add_parser("realtime", help="Poll, record or replay GTFS-RT vehicle positions.")
+    realtime.add_argument("--archive-dir", help="Also archive every raw snapshot here (live mode).")
+    realtime.add_argument("--record-only", action="store_true", help="Archive snapshots to --archive-dir without writing to the DB.")
+    realtime.add_argument("--replay", metavar="ARCHIVE_DIR", help="Replay archived snapshots instead of polling the live feed.")
+    realtime.add_argument("--pace", choices=["max", "wallclock"], default="max", help="Replay as fast as possible or at the recorded pace.")
+    realtime.add_argument("--speed", type=float, default=1.0, help="Wall-clock replay speed multiplier.")
+    realtime.add_argument("--from", dest="start_date", type=datetime.date.fromisoformat, help="First partition to replay (YYYY-MM-DD).")
+    realtime.add_argument("--to", dest="end_date", type=datetime.date.fromisoformat, help="Last partition to replay (YYYY-MM-DD).")
+    realtime.set_defaults(handler=run_realtime)
+
+    detect = sub.add_parser("detect", help="Run the conflict diagnostics loop.")
+    detect.set_defaults(handler=run_detect)
+
+    archive = sub.add_parser("archive", help="Export closed days of pings and conflicts to Parquet.")
+    archive.add_argument("--dir", default="archive/history", help="Parquet archive root.")
+    archive.add_argument("--prune", action="store_true", help="Delete archived rows from Postgres after export.")
+    archive.set_defaults(handler=run_archive)
+
+    history = sub.add_parser("history", help="Route/day or conflict/day aggregates from the Parquet archive.")
+    history.add_argument("report", choices=["routes", "conflicts"])
+    history.add_argument("--dir", default="archive/history", help="Parquet archive root.")
+    history.add_argument("--from", dest="start_date", type=datetime.date.fromisoformat, help="First day (YYYY-MM-DD).")
+    history.add_argument("--to", dest="end_date", type=datetime.date.fromisoformat, help="Last day (YYYY-MM-DD).")
+    history.add_argument("--route", help="Only this route_id (routes report).")
+    history.set_defaults(handler=run_history)
+
+    serve = sub.add_parser("serve", help="Serve the web API with uvicorn.")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8000)
+    serve.add_argument("--workers", type=int, default=1, help="Uvicorn worker processes; /metrics merges all of them.")
+    serve.set_defaults(handler=run_serve)
+
+    return parser
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == "realtime" and args.record_only and not args.archive_dir:
+        parser.error("--record-only requires --archive-dir")
+    if args.command == "realtime" and args.speed <= 0:
+        parser.error("--speed must be greater than 0")
+    args.handler(args)
+
+if __name__ == "__main__":
+    main()
@@ -1,161 +1,291 @@
-import psycopg2
-import os
 import time
-from dotenv import load_dotenv
+from engine.settings import get_db_connection
+from engine.instrumentation import stage, timed_query, export_textfile
 
-base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-load_dotenv(os.path.join(base_dir, '.env'))
+# THE DIAGNOSTIC QUERY
+DIAGNOSTIC_SQL = """
+    WITH 
+    -- 1. Active Disruptions
+    -- One typed, deduplicated row per permit, maintained by trigger (see ingest_permits.py).
+    -- NOT MATERIALIZED lets every check below use the partial GiST index on active rows.
+    active_disruptions AS NOT MATERIALIZED (
+        SELECT disruption_type, status, description, validity, geom
+        FROM disruptions
+        WHERE active
+          AND validity && tstzrange(NOW(), NULL)
+    ),
+    
+    -- CHECK A: Hard Blocks (Route Severed)
+    -- FIXED: Now joins 'active_disruptions' instead of raw 'vw_road_closures'
+    check_a_hard_blocks AS (
+        SELECT 
+            r.route_short_name,
+            d.disruption_type,
+            d.description,
+            'CRITICAL' as severity,
+            d.geom
+        FROM routes r
+        JOIN trips t ON r.route_id = t.route_id
+        JOIN shape_geoms s ON t.shape_id = s.shape_id
+        JOIN active_disruptions d ON ST_Intersects(s.geom, d.geom)
+        WHERE d.disruption_type = 'CLOSURE' -- Specific filter for closures
+        GROUP BY r.route_short_name, d.disruption_type, d.description, d.geom
+    ),
 
-DB_PARAMS = {
-    "dbname": os.getenv("DB_NAME"),
-    "user": os.getenv("DB_USER"),
-    "password": os.getenv("DB_PASSWORD"),
-    "host": os.getenv("DB_HOST"),
-    "port": os.getenv("DB_PORT", "5432")
+    -- CHECK B: The "Local Squeeze" (Friction % Calculation)
+    -- Logic: If a permit touches the route, how much of the 10m-wide road does it consume?
+    check_b_squeeze AS (
+        SELECT 
+            r.route_short_name,
+            d.disruption_type,
+            d.description,
+            -- THE MATH TRAP FIX:
+            -- Denominator is based on the INTERSECTION length, not the ROUTE length.
+            CASE 
+                WHEN ST_Length(ST_Intersection(s.geom, d.geom)) < 1 THEN 0 
+                ELSE (
+                    ST_Area(ST_Intersection(ST_Buffer(s.geom, 5), d.geom)) -- Area of overlap
+                    / 
+                    (ST_Length(ST_Intersection(s.geom, d.geom)) * 10) -- Area of ideal road (10m wide)
+                ) * 100
+            END as blockage_pct,
+            d.geom
+        FROM routes r
+        JOIN trips t ON r.route_id = t.route_id
+        JOIN shape_geoms s ON t.shape_id = s.shape_id
+        JOIN active_disruptions d ON ST_Intersects(s.geom, d.geom)
+        WHERE d.disruption_type != 'CLOSURE' -- Closures are handled in Check A
+        GROUP BY r.route_short_name, d.disruption_type, d.description, s.geom, d.geom
+    ),
+
+    -- CHECK C: Accessibility (Stop Encapsulation)
+    -- Logic: HAMILTON RULE - Only flag if the stop is STRICTLY INSIDE the polygon.
+    check_c_stops AS (
+        SELECT 
+            s.stop_name,
+            s.stop_id,
+            d.disruption_type,
+            d.description,
+            d.geom
+        FROM stops s
+        JOIN active_disruptions d 
+        -- Uses ST_Intersects for strict containment (Stop must be INSIDE work zone)
+        ON ST_Intersects(s.geom, d.geom) 
+    ),
+
+    -- CHECK D: Live Confirmation (Real-Time)
+    -- Logic: Is a bus currently driving through a permit zone?
+    check_d_live AS (
+        SELECT DISTINCT ON (vehicle_id)
+            vehicle_id,
+            route_id,
+            d.description,
+            speed,
+            d.geom
+        FROM live_vehicle_positions p
+        JOIN active_disruptions d ON ST_Intersects(p.geom, d.geom)
+        WHERE p.timestamp > NOW() - INTERVAL '2 minutes' -- Only fresh data
+        ORDER BY vehicle_id, timestamp DESC
+    )
+
+    -- AGGREGATE REPORT
+    -- Each row is one conflict: (type, target, cause, metric, disruption geom)
+    SELECT 'HARD_BLOCK' as type, route_short_name as id, description, severity::text as metric, geom FROM check_a_hard_blocks
+    UNION ALL
+    -- A route can cross the same permit on several shapes; report the worst squeeze once
+    SELECT 'SQUEEZE' as type, route_short_name as id, description, ROUND(MAX(blockage_pct))::text || '%' as metric, geom FROM check_b_squeeze WHERE blockage_pct > 15
+    GROUP BY route_short_name, description, geom
+    UNION ALL
+    -- Keyed by stop_id: both sides of a street often share a stop_name
+    SELECT 'STOP_CLOSED' as type, CONCAT_WS(' ', stop_id, stop_name) as id, description, 'INACCESSIBLE' as metric, geom FROM check_c_stops
+    UNION ALL
+    SELECT 'LIVE_IMPACT' as type, vehicle_id as id, description, speed::text || ' km/h' as metric, geom FROM check_d_live;
+"""
+
+# Flip rows whose validity ended since the last cycle out of the partial index
+EXPIRE_SQL = """
+    UPDATE disruptions SET active = FALSE
+    WHERE active AND upper(validity) <= NOW();
+"""
+
+# ANSI colours for the change log
+COLORS = {
+    "HARD_BLOCK": "\033[91m", # Red
+    "LIVE_IMPACT": "\033[93m", # Yellow
+    "STOP_CLOSED": "\033[96m", # Cyan
 }
 
+def initialize_schema(conn):
+    """
+    Creates the conflict event log.
+    A row is opened the first time a conflict is detected and closed
+    (closed_at set) on the first cycle it is no longer detected.
+    """
+    cur = conn.cursor()
+    print("🔨 Verifying Conflict Event Schema...")
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS conflict_events (
+            id BIGSERIAL PRIMARY KEY,
+            conflict_type VARCHAR(20),
+            target_id TEXT,
+            description TEXT,
+            metric VARCHAR(50),
+            first_seen TIMESTAMPTZ DEFAULT NOW(),
+            closed_at TIMESTAMPTZ,
+            geom GEOMETRY(Geometry, 4326)
+        );
+    """)
+
+    # STOP_CLOSED targets are "stop_id stop_name" and can outgrow the original VARCHAR(255)
+    cur.execute("ALTER TABLE conflict_events ALTER COLUMN target_id TYPE TEXT;")
+
+    # Only the open set is read every cycle, so keep it in its own small index
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_conflict_events_open ON conflict_events (conflict_type, target_id) WHERE closed_at IS NULL;")
+
+    # One open row per conflict, even if two detect processes overlap.
+    # Close any duplicates left by earlier overlaps first, or the index cannot be built.
+    cur.execute("""
+        UPDATE conflict_events e SET closed_at = NOW()
+        FROM conflict_events keep
+        WHERE e.closed_at IS NULL AND keep.closed_at IS NULL
+          AND keep.id < e.id
+          AND keep.conflict_type = e.conflict_type
+          AND keep.target_id = e.target_id
+          AND COALESCE(keep.description, '') = COALESCE(e.description, '')
+          AND ST_AsEWKB(keep.geom) = ST_AsEWKB(e.geom)
+          AND to_regclass('idx_conflict_events_open_key') IS NULL;
+    """)
+    cur.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_conflict_events_open_key
+        ON conflict_events (conflict_type, target_id, md5(COALESCE(description, '')), md5(ST_AsEWKB(geom)))
+        WHERE closed_at IS NULL;
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_conflict_events_geom ON conflict_events USING GIST(geom);")
+    # Closed events are exported (and pruned) per day of closure by engine/archive_history.py
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_conflict_events_closed ON conflict_events (closed_at) WHERE closed_at IS NOT NULL;")
+
+    conn.commit()
+    print("✅ Conflict Event Schema Ready.")
+
+def sync_conflict_events(cur, results):
+    """
+    Diffs this cycle's conflicts against the open rows in conflict_events.
+    Only changes are written: new conflicts are inserted, cleared ones are
+    closed and a changed metric is updated in place.
+    Returns (detected, opened, closed); the last two are lists of
+    (type, target, description, metric).
+    """
+    from psycopg2.extras import execute_values
+
+    # Geometry comes back as hex EWKB on both sides, so it can be part of the key
+    detected = {}
+    for alert_type, target, desc, metric, geom in results:
+        detected[(alert_type, target, desc, geom)] = metric
+
+    cur.execute("""
+        SELECT id, conflict_type, target_id, description, metric, geom
+        FROM conflict_events
+        WHERE closed_at IS NULL;
+    """)
+    open_events = {}
+    for event_id, alert_type, target, desc, metric, geom in cur.fetchall():
+        open_events[(alert_type, target, desc, geom)] = (event_id, metric)
+
+    opened = [key for key in detected if key not in open_events]
+    closed = [key for key in open_events if key not in detected]
+    # A live bus's speed moves on almost every ping; keep the speed it was first seen at
+    # so an ongoing LIVE_IMPACT costs no writes until it clears
+    changed = [
+        (detected[key], open_events[key][0])
+        for key in detected
+        if key in open_events and key[0] != "LIVE_IMPACT" and open_events[key][1] != detected[key]
+    ]
+
+    if opened:
+        # Another detect process may have opened the same conflict since our read
+        execute_values(cur, """
+            INSERT INTO conflict_events (conflict_type, target_id, description, metric, geom)
+            VALUES %s
+            ON CONFLICT DO NOTHING;
+        """, [(t, target, desc, detected[(t, target, desc, geom)], geom) for t, target, desc, geom in opened],
+            template="(%s, %s, %s, %s, %s::geometry)")
+
+    if closed:
+        cur.execute(
+            "UPDATE conflict_events SET closed_at = NOW() WHERE id = ANY(%s);",
+            ([open_events[key][0] for key in closed],)
+        )
+
+    if changed:
+        execute_values(cur, """
+            UPDATE conflict_events SET metric = v.metric
+            FROM (VALUES %s) AS v(metric, id)
+            WHERE conflict_events.id = v.id;
+        """, changed)
+
+    return (
+        len(detected),
+        [(t, target, desc, detected[(t, target, desc, geom)]) for t, target, desc, geom in opened],
+        [(t, target, desc, open_events[(t, target, desc, geom)][1]) for t, target, desc, geom in closed],
+    )
+
+def print_event(prefix, alert_type, target, desc, metric):
+    # Truncate long descriptions
+    desc_short = (desc[:40] + '..') if desc and len(desc) > 40 else str(desc)
+    color = COLORS.get(alert_type, "\033[97m") # White by default
+    print(f"{color}{prefix} {alert_type:<15} | {str(target):<15} | {str(metric):<12} | {desc_short}\033[0m")
+
+@stage("detect", "detect_conflicts")
 def detect_conflicts():
+    """Runs one diagnostic cycle. Returns the number of active conflicts, or None if the cycle failed."""
     try:
-        conn = psycopg2.connect(**DB_PARAMS)
+        conn = get_db_connection()
+        if not conn: return
         cur = conn.cursor()
 
-        # THE DIAGNOSTIC QUERY
-        sql = """
-        WITH 
-        -- 1. Standardize All Disruptions First
-        -- This ensures we always have 'disruption_type', 'end_time', etc.
-        active_disruptions AS (
-            -- We pull directly from live_permits to bypass the view logic
-            SELECT 
-                hazard_type as disruption_type, 
-                metadata->>'status' as status, 
-                description,
-                start_time,
-                end_time,
-                geom 
-            FROM live_permits 
-            WHERE end_time > NOW()
-            
-            UNION ALL
-            
-            -- Keep the original view data too so we don't lose real city data
-            SELECT disruption_type, status, description, start_time, end_time, geom 
-            FROM vw_all_disruptions 
-            WHERE end_time > NOW()
-        ),
-        
-        -- CHECK A: Hard Blocks (Route Severed)
-        -- FIXED: Now joins 'active_disruptions' instead of raw 'vw_road_closures'
-        check_a_hard_blocks AS (
-            SELECT 
-                r.route_short_name,
-                d.disruption_type,
-                d.description,
-                'CRITICAL' as severity
-            FROM routes r
-            JOIN trips t ON r.route_id = t.route_id
-            JOIN shape_geoms s ON t.shape_id = s.shape_id
-            JOIN active_disruptions d ON ST_Intersects(s.geom, d.geom)
-            WHERE TRIM(d.disruption_type) = 'CLOSURE' -- Specific filter for closures
-            GROUP BY r.route_short_name, d.disruption_type, d.description
-        ),
-
-        -- CHECK B: The "Local Squeeze" (Friction % Calculation)
-        -- Logic: If a permit touches the route, how much of the 10m-wide road does it consume?
-        check_b_squeeze AS (
-            SELECT 
-                r.route_short_name,
-                d.disruption_type,
-                d.description,
-                -- THE MATH TRAP FIX:
-                -- Denominator is based on the INTERSECTION length, not the ROUTE length.
-                CASE 
-                    WHEN ST_Length(ST_Intersection(s.geom, d.geom)) < 1 THEN 0 
-                    ELSE (
-                        ST_Area(ST_Intersection(ST_Buffer(s.geom, 5), d.geom)) -- Area of overlap
-                        / 
-                        (ST_Length(ST_Intersection(s.geom, d.geom)) * 10) -- Area of ideal road (10m wide)
-                    ) * 100
-                END as blockage_pct
-            FROM routes r
-            JOIN trips t ON r.route_id = t.route_id
-            JOIN shape_geoms s ON t.shape_id = s.shape_id
-            JOIN active_disruptions d ON ST_Intersects(s.geom, d.geom)
-            WHERE d.disruption_type != 'CLOSURE' -- Closures are handled in Check A
-            GROUP BY r.route_short_name, d.disruption_type, d.description, s.geom, d.geom
-        ),
-
-        -- CHECK C: Accessibility (Stop Encapsulation)
-        -- Logic: HAMILTON RULE - Only flag if the stop is STRICTLY INSIDE the polygon.
-        check_c_stops AS (
-            SELECT 
-                s.stop_name,
-                s.stop_id,
-                d.disruption_type,
-                d.description
-            FROM stops s
-            JOIN active_disruptions d 
-            -- Uses ST_Intersects for strict containment (Stop must be INSIDE work zone)
-            ON ST_Intersects(s.geom, d.geom) 
-        ),
-
-        -- CHECK D: Live Confirmation (Real-Time)
-        -- Logic: Is a bus currently driving through a permit zone?
-        check_d_live AS (
-            SELECT DISTINCT ON (vehicle_id)
-                vehicle_id,
-                route_id,
-                d.description,
-                speed
-            FROM live_vehicle_positions p
-            JOIN active_disruptions d ON ST_Intersects(p.geom, d.geom)
-            WHERE p.timestamp > NOW() - INTERVAL '2 minutes' -- Only fresh data
-            ORDER BY vehicle_id, timestamp DESC
-        )
+        with stage("detect", "expire_disruptions"):
+            cur.execute(EXPIRE_SQL)
 
-        -- AGGREGATE REPORT
-        SELECT 'HARD_BLOCK' as type, route_short_name as id, description, severity::text as metric FROM check_a_hard_blocks
-        UNION ALL
-        SELECT 'SQUEEZE' as type, route_short_name as id, description, ROUND(blockage_pct)::text || '%' as metric FROM check_b_squeeze WHERE blockage_pct > 15
-        UNION ALL
-        SELECT 'STOP_CLOSED' as type, stop_name as id, description, 'INACCESSIBLE' as metric FROM check_c_stops
-        UNION ALL
-        SELECT 'LIVE_IMPACT' as type, vehicle_id as id, description, speed::text || ' km/h' as metric FROM check_d_live;
-        """
-
-        cur.execute(sql)
+        timed_query(cur, "detect", "diagnostic", DIAGNOSTIC_SQL)
         results = cur.fetchall()
 
-        # --- THE DASHBOARD ---
-        os.system('cls' if os.name == 'nt' else 'clear')
-        print(f"🧠 TRANSITMIND: DIAGNOSTIC ENGINE (HAMILTON CONFIG)")
-        print(f"================================================================================")
-        print(f"{'TYPE':<15} | {'TARGET':<15} | {'METRIC':<12} | {'CAUSE'}")
-        print(f"--------------------------------------------------------------------------------")
-        
-        if not results:
-            print("✅ SYSTEM NOMINAL. No critical conflicts detected.")
-        
-        for row in results:
-            alert_type, target, desc, metric = row
-            # Truncate long descriptions
-            desc_short = (desc[:40] + '..') if desc and len(desc) > 40 else str(desc)
-            
-            # Color coding
-            color = "\033[97m" # White
-            if alert_type == "HARD_BLOCK": color = "\033[91m" # Red
-            elif alert_type == "LIVE_IMPACT": color = "\033[93m" # Yellow
-            elif alert_type == "STOP_CLOSED": color = "\033[96m" # Cyan
-            
-            print(f"{color}{alert_type:<15} | {target:<15} | {metric:<12} | {desc_short}\033[0m")
-
-        print(f"================================================================================")
+        # --- THE EVENT LOG ---
+        # Persist only what changed since the last cycle
+        with stage("detect", "event_sync"):
+            detected, opened, closed = sync_conflict_events(cur, results)
+            conn.commit()
+
+        for alert_type, target, desc, metric in opened:
+            print_event("🆕 OPENED", alert_type, target, desc, metric)
+        for alert_type, target, desc, metric in closed:
+            print_event("✅ CLOSED", alert_type, target, desc, metric)
+
+        print(f"🧠 {time.strftime('%H:%M:%S')} | {detected} active conflicts (+{len(opened)} / -{len(closed)})")
+        cur.close()
         conn.close()
+        return detected
 
     except Exception as e:
         print(f"❌ Analysis Error: {e}")
 
+def run_loop():
+    print("🧠 Starting TransitMind Diagnostic Engine (Hamilton Config)...")
+
+    # 1. Connect & Init
+    conn = get_db_connection()
+    if conn:
+        initialize_schema(conn)
+        conn.close() # Close init connection
+
+    # 2. Start Loop
+    try:
+        while True:
+            detect_conflicts()
+            export_textfile("detect")
+            time.sleep(10) # Run analysis every 10 seconds
+    except KeyboardInterrupt:
+        print("\n🛑 Diagnostics stopped by user.")
+
 if __name__ == "__main__":
-    while True:
-        detect_conflicts()
-        time.sleep(10) # Run analysis every 10 seconds
\ No newline at end of file
+    run_loop()
\ No newline at end of file
@@ -0,0 +1,48 @@
+import datetime
+import gzip
+import os
+
+# Layout: <archive_dir>/date=YYYY-MM-DD/HHMMSS.ffffff.pb.gz (UTC fetch time)
+PARTITION_PREFIX = "date="
+SUFFIX = ".pb.gz"
+
+def archive_snapshot(archive_dir, payload, fetched_at=None):
+    """
+    Writes one raw GTFS-RT payload, gzip-compressed, into its day partition.
+    Returns the path written.
+    """
+    fetched_at = fetched_at or datetime.datetime.now(datetime.timezone.utc)
+    partition = os.path.join(archive_dir, f"{PARTITION_PREFIX}{fetched_at:%Y-%m-%d}")
+    os.makedirs(partition, exist_ok=True)
+
+    path = os.path.join(partition, f"{fetched_at:%H%M%S.%f}{SUFFIX}")
+    # Write-then-rename so a replay never picks up a half-written snapshot
+    tmp_path = path + ".tmp"
+    with gzip.open(tmp_path, "wb") as f:
+        f.write(payload)
+    os.replace(tmp_path, path)
+    return path
+
+def iter_snapshots(archive_dir, start_date=None, end_date=None):
+    """
+    Yields (fetched_at, payload) in fetch order.
+    start_date / end_date are inclusive datetime.date bounds on the partitions.
+    """
+    if not os.path.isdir(archive_dir):
+        return
+
+    for partition in sorted(os.listdir(archive_dir)):
+        if not partition.startswith(PARTITION_PREFIX):
+            continue
+        day = datetime.date.fromisoformat(partition[len(PARTITION_PREFIX):])
+        if (start_date and day < start_date) or (end_date and day > end_date):
+            continue
+
+        partition_dir = os.path.join(archive_dir, partition)
+        for name in sorted(os.listdir(partition_dir)):
+            if not name.endswith(SUFFIX):
+                continue
+            clock = datetime.datetime.strptime(name[:-len(SUFFIX)], "%H%M%S.%f").time()
+            fetched_at = datetime.datetime.combine(day, clock, tzinfo=datetime.timezone.utc)
+            with gzip.open(os.path.join(partition_dir, name), "rb") as f:
+                yield fetched_at, f.read()
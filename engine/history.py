@@ -0,0 +1,86 @@
+import os
+from engine.archive_history import ARCHIVE_DIR
+
+# Analytics over the Parquet archive written by engine/archive_history.py.
+# Runs entirely on the files (DuckDB), never on the OLTP database.
+
+ROUTE_DAY_SQL = """
+    SELECT
+        date,
+        route_id,
+        COUNT(*) AS pings,
+        COUNT(DISTINCT vehicle_id) AS vehicles,
+        COUNT(DISTINCT trip_id) AS trips,
+        ROUND(AVG(speed), 2) AS avg_speed,
+        ROUND(AVG(CASE WHEN speed = 0 THEN 1 ELSE 0 END) * 100, 1) AS stopped_pct
+    FROM vehicle_positions
+    WHERE (?::DATE IS NULL OR date >= ?::DATE)
+      AND (?::DATE IS NULL OR date <= ?::DATE)
+      AND (?::VARCHAR IS NULL OR route_id = ?::VARCHAR)
+    GROUP BY date, route_id
+    ORDER BY date, route_id
+"""
+
+CONFLICT_DAY_SQL = """
+    SELECT
+        date,
+        conflict_type,
+        COUNT(*) AS events,
+        COUNT(DISTINCT target_id) AS targets,
+        ROUND(AVG(EXTRACT(EPOCH FROM closed_at - first_seen)) / 60, 1) AS avg_minutes_open
+    FROM conflict_events
+    WHERE (?::DATE IS NULL OR date >= ?::DATE)
+      AND (?::DATE IS NULL OR date <= ?::DATE)
+    GROUP BY date, conflict_type
+    ORDER BY date, conflict_type
+"""
+
+def connect(archive_dir=ARCHIVE_DIR):
+    """
+    In-memory DuckDB connection with one view per archived dataset.
+    The hive `date` partition column is exposed, so date filters prune whole files.
+    """
+    import duckdb
+
+    con = duckdb.connect()
+    for dataset in ("vehicle_positions", "conflict_events"):
+        pattern = os.path.join(archive_dir, dataset, "date=*", "*.parquet")
+        if not os.path.isdir(os.path.join(archive_dir, dataset)):
+            continue
+        # Views cannot take bound parameters, so quote the path as a SQL literal
+        literal = "'" + pattern.replace("'", "''") + "'"
+        con.execute(f"""
+            CREATE VIEW {dataset} AS
+            SELECT * FROM read_parquet({literal}, hive_partitioning = true)
+        """)
+    return con
+
+def has_dataset(archive_dir, dataset):
+    if os.path.isdir(os.path.join(archive_dir, dataset)):
+        return True
+    print(f"⚠️  No archived {dataset} in {archive_dir}. Run `transitmind archive` first.")
+    return False
+
+def route_day_summary(archive_dir=ARCHIVE_DIR, start_date=None, end_date=None, route_id=None):
+    """Per route, per day: pings, vehicles, trips, average speed and % of pings stopped."""
+    if not has_dataset(archive_dir, "vehicle_positions"): return []
+    con = connect(archive_dir)
+    try:
+        return con.execute(ROUTE_DAY_SQL, [start_date, start_date, end_date, end_date, route_id, route_id]).fetchall()
+    finally:
+        con.close()
+
+def conflict_day_summary(archive_dir=ARCHIVE_DIR, start_date=None, end_date=None):
+    """Per conflict type, per day (of closure): event count, distinct targets, mean time open."""
+    if not has_dataset(archive_dir, "conflict_events"): return []
+    con = connect(archive_dir)
+    try:
+        return con.execute(CONFLICT_DAY_SQL, [start_date, start_date, end_date, end_date]).fetchall()
+    finally:
+        con.close()
+
+def print_table(header, rows):
+    print(" | ".join(f"{h:<12}" for h in header))
+    print("-" * (15 * len(header)))
+    for row in rows:
+        print(" | ".join(f"{str(v):<12}" for v in row))
@@ -1,23 +1,9 @@
-import requests
-import psycopg2
-from psycopg2.extras import Json
 import datetime
 import json
-import os
-from dotenv import load_dotenv
-
-base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-load_dotenv(os.path.join(base_dir, '.env'))
+from engine.settings import get_db_connection
+from engine.instrumentation import stage, export_textfile
 
 # --- 1. CONFIGURATION ---
-DB_PARAMS = {
-    "dbname": os.getenv("DB_NAME"),
-    "user": os.getenv("DB_USER"),
-    "password": os.getenv("DB_PASSWORD"),
-    "host": os.getenv("DB_HOST"),
-    "port": os.getenv("DB_PORT", "5432")
-}
-
 URLS = {
     "Film": "https://services1.arcgis.com/DkpbFZAaJs7sZX2x/arcgis/rest/services/Active_Film_Permits/FeatureServer/0/query?where=1%3D1&outFields=*&f=json",
     "Occupancy": "https://services1.arcgis.com/DkpbFZAaJs7sZX2x/arcgis/rest/services/Active_Temporary_Lane_and_Sidewalk_Occupancy_Permits/FeatureServer/0/query?where=1%3D1&outFields=*&f=json",
@@ -28,13 +14,6 @@ URLS = {
     "Capital_Projects": "https://services1.arcgis.com/DkpbFZAaJs7sZX2x/arcgis/rest/services/CP_List_of_Geomatics_Capital_Projects/FeatureServer/0/query?where=1%3D1&outFields=*&f=json"
 }
 
-def get_db_connection():
-    try:
-        return psycopg2.connect(**DB_PARAMS)
-    except Exception as e:
-        print(f"Error connecting to database: {e}")
-        return None
-
 def initialize_schema(conn):
     """
     Idempotent Schema Initialization.
@@ -62,71 +41,139 @@ def initialize_schema(conn):
     cur.execute("CREATE INDEX IF NOT EXISTS idx_live_permits_geom ON live_permits USING GIST(geom);")
     cur.execute("CREATE INDEX IF NOT EXISTS idx_live_permits_time ON live_permits (start_time, end_time);")
 
-    # 3. Create Views (Based on your schema_dump.sql)
-    print("   - Updating Views...")
-    
-    # Capital Projects View
+    # 3. Retire the per-layer vw_* views: they re-parsed the JSONB (with hard ::uuid casts)
+    # on every read and nothing reads them since the typed disruptions layer below.
+    # vw_all_disruptions may still be the old UNION over them, so it goes first.
+    cur.execute("DROP VIEW IF EXISTS vw_all_disruptions;")
+    cur.execute("DROP VIEW IF EXISTS vw_capital_projects, vw_utility_permits, vw_road_closures, vw_occupancy_permits;")
+
+    # 4. Typed Disruption Layer
+    # One row per permit, parsed out of the JSONB once (on write) by a trigger,
+    # so the diagnostic never re-parses metadata or scans a permit twice.
+    print("   - Updating Disruption Layer...")
     cur.execute("""
-        CREATE OR REPLACE VIEW vw_capital_projects AS
-        SELECT 
-            ((metadata -> 'original_fields') ->> 'globalid')::uuid AS id,
-            ((metadata -> 'original_fields') ->> 'Project_Name') AS project_name,
-            ((metadata -> 'original_fields') ->> 'Status') AS status,
-            to_timestamp((((metadata -> 'original_fields') ->> 'Date_Submitted')::bigint / 1000.0)) AS date_submitted,
-            to_timestamp((((metadata -> 'original_fields') ->> 'Date_Requested_Completion')::bigint / 1000.0)) AS estimated_completion,
-            geom
-        FROM live_permits
-        WHERE source_layer = 'Capital_Projects';
+        CREATE TABLE IF NOT EXISTS disruptions (
+            permit_id VARCHAR(100) PRIMARY KEY,
+            source_layer VARCHAR(50),
+            disruption_type VARCHAR(50),
+            status VARCHAR(50),
+            description TEXT,
+            validity TSTZRANGE,
+            active BOOLEAN,
+            geom GEOMETRY(Geometry, 4326)
+        );
     """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_disruptions_validity ON disruptions USING GIST(validity);")
+    # Partial index: the diagnostic only ever joins against currently active rows
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_disruptions_active_geom ON disruptions USING GIST(geom) WHERE active;")
 
-    # Utility Permits View
+    # Runs inside the live_permits trigger: a malformed city date must become a NULL
+    # bound, not abort the INSERT (and with it the rest of the layer's transaction)
     cur.execute("""
-        CREATE OR REPLACE VIEW vw_utility_permits AS
-        SELECT 
-            ((metadata -> 'original_fields') ->> 'GlobalID')::uuid AS id,
-            ((metadata -> 'original_fields') ->> 'Utility_Company_Name') AS company_name,
-            ((metadata -> 'original_fields') ->> 'Status') AS status,
-            ((metadata -> 'original_fields') ->> 'Stream_Class') AS impact_level,
-            geom
-        FROM live_permits
-        WHERE source_layer = 'Utility_Consent';
+        CREATE OR REPLACE FUNCTION epoch_ms_to_timestamptz(ms TEXT) RETURNS TIMESTAMPTZ AS $$
+            SELECT CASE WHEN ms ~ '^-?\\d{1,13}$' THEN to_timestamp(ms::bigint / 1000.0) END;
+        $$ LANGUAGE sql IMMUTABLE;
     """)
 
-    # Road Closures View
     cur.execute("""
-        CREATE OR REPLACE VIEW vw_road_closures AS
-        SELECT 
-            ((metadata -> 'original_fields') ->> 'globalid')::uuid AS id,
-            ((metadata -> 'original_fields') ->> 'closure_to_what_street_name') AS road_name,
-            ((metadata -> 'original_fields') ->> 'Description') AS description,
-            ((metadata -> 'original_fields') ->> 'Close_Both_Traffic_Directions') AS closure_type,
-            geom
-        FROM live_permits
-        WHERE source_layer = 'Closures';
+        CREATE OR REPLACE FUNCTION upsert_disruption(p live_permits) RETURNS void AS $$
+        DECLARE
+            f JSONB := p.metadata -> 'original_fields';
+            d_type TEXT;
+            d_desc TEXT;
+            d_start TIMESTAMPTZ := p.start_time;
+            d_end TIMESTAMPTZ := p.end_time;
+        BEGIN
+            -- Per-layer field mapping (formerly the vw_* views); other layers keep their hazard_type
+            CASE p.source_layer
+                WHEN 'Closures' THEN
+                    d_type := 'CLOSURE';
+                    d_desc := f ->> 'Description';
+                    d_start := COALESCE(d_start, epoch_ms_to_timestamptz(f ->> 'Start_Date_of_Closure'));
+                    d_end := COALESCE(d_end, epoch_ms_to_timestamptz(f ->> 'End_Date_of_Closure'));
+                WHEN 'Capital_Projects' THEN
+                    d_type := 'CONSTRUCTION';
+                    d_desc := f ->> 'Project_Name';
+                    d_start := COALESCE(d_start, epoch_ms_to_timestamptz(f ->> 'Date_Submitted'));
+                    d_end := COALESCE(d_end, epoch_ms_to_timestamptz(f ->> 'Date_Requested_Completion'));
+                WHEN 'Utility_Consent' THEN
+                    d_type := 'UTILITY_WORK';
+                    d_desc := f ->> 'Utility_Company_Name';
+                    d_start := COALESCE(d_start, epoch_ms_to_timestamptz(f ->> 'Date_Approved'));
+                    d_end := COALESCE(d_end, epoch_ms_to_timestamptz(f ->> 'Date_Expired'));
+                WHEN 'Occupancy' THEN
+                    d_type := 'OCCUPANCY';
+                    d_desc := f ->> 'Item_for_Occupancy';
+                ELSE
+                    d_type := p.hazard_type;
+            END CASE;
+
+            -- Bad city data (end before start) would make tstzrange() raise
+            IF d_start > d_end THEN
+                d_start := d_end;
+            END IF;
+
+            -- A missing or malformed end date is open-ended, like the range itself
+            INSERT INTO disruptions (permit_id, source_layer, disruption_type, status, description, validity, active, geom)
+            VALUES (
+                p.permit_id, p.source_layer, d_type, LEFT(p.metadata ->> 'status', 50),
+                COALESCE(d_desc, p.description), tstzrange(d_start, d_end),
+                d_end IS NULL OR d_end > NOW(), p.geom
+            )
+            ON CONFLICT (permit_id) DO UPDATE SET
+                source_layer = EXCLUDED.source_layer,
+                disruption_type = EXCLUDED.disruption_type,
+                status = EXCLUDED.status,
+                description = EXCLUDED.description,
+                validity = EXCLUDED.validity,
+                active = EXCLUDED.active,
+                geom = EXCLUDED.geom;
+        END;
+        $$ LANGUAGE plpgsql;
     """)
-    
-    # Occupancy View
+
     cur.execute("""
-        CREATE OR REPLACE VIEW vw_occupancy_permits AS
-        SELECT 
-            ((metadata -> 'original_fields') ->> 'globalid')::uuid AS id,
-            ((metadata -> 'original_fields') ->> 'Item_for_Occupancy') AS obstruction_type,
-            ((metadata -> 'original_fields') ->> 'Location') AS address,
-            geom
-        FROM live_permits
-        WHERE source_layer = 'Occupancy';
+        CREATE OR REPLACE FUNCTION refresh_disruption() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                DELETE FROM disruptions WHERE permit_id = OLD.permit_id;
+                RETURN OLD;
+            END IF;
+            PERFORM upsert_disruption(NEW);
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql;
     """)
 
-    # Master View (vw_all_disruptions)
+    # The hourly re-ingest upserts every permit; only rows that really changed hit disruptions
+    cur.execute("DROP TRIGGER IF EXISTS trg_disruptions_insert_delete ON live_permits;")
+    cur.execute("""
+        CREATE TRIGGER trg_disruptions_insert_delete
+        AFTER INSERT OR DELETE ON live_permits
+        FOR EACH ROW EXECUTE FUNCTION refresh_disruption();
+    """)
+    cur.execute("DROP TRIGGER IF EXISTS trg_disruptions_update ON live_permits;")
     cur.execute("""
-        CREATE OR REPLACE VIEW vw_all_disruptions AS
-        SELECT id, 'CLOSURE' AS disruption_type, description, geom FROM vw_road_closures
-        UNION ALL
-        SELECT id, 'CONSTRUCTION' AS disruption_type, project_name AS description, geom FROM vw_capital_projects
-        UNION ALL
-        SELECT id, 'UTILITY_WORK' AS disruption_type, company_name AS description, geom FROM vw_utility_permits
-        UNION ALL
-        SELECT id, 'OCCUPANCY' AS disruption_type, obstruction_type AS description, geom FROM vw_occupancy_permits;
+        CREATE TRIGGER trg_disruptions_update
+        AFTER UPDATE ON live_permits
+        FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*) EXECUTE FUNCTION refresh_disruption();
+    """)
+
+    # Backfill permits ingested before the trigger existed
+    cur.execute("""
+        SELECT upsert_disruption(lp) FROM live_permits lp
+        WHERE NOT EXISTS (SELECT 1 FROM disruptions d WHERE d.permit_id = lp.permit_id);
+    """)
+
+    # Rows written while a NULL end date still meant inactive
+    cur.execute("UPDATE disruptions SET active = TRUE WHERE NOT active AND upper_inf(validity);")
+
+    # Master View (vw_all_disruptions), kept for ad-hoc queries; now a thin read of disruptions
+    cur.execute("""
+        CREATE VIEW vw_all_disruptions AS
+        SELECT permit_id AS id, disruption_type, status, description,
+               lower(validity) AS start_time, upper(validity) AS end_time, geom
+        FROM disruptions;
     """)
 
     conn.commit()
@@ -147,6 +194,8 @@ def esri_to_geojson(esri_geom):
     return None
 
 def normalize_data(source, feature):
+    from psycopg2.extras import Json
+
     props = feature.get("attributes", {})
     raw_geom = feature.get("geometry", {})
     geom = esri_to_geojson(raw_geom)
@@ -167,7 +216,11 @@ def normalize_data(source, feature):
 
     return (str(permit_id), source, hazard_type, description, start_time, end_time, Json(metadata), geom)
 
-def ingest_layers():
+@stage("permits", "ingest_layers")
+def ingest_layers(urls=URLS):
+    """Ingests every layer. Returns the number of permits committed, or None without a database."""
+    import requests
+
     conn = get_db_connection()
     if not conn: return
     
@@ -175,44 +228,55 @@ def ingest_layers():
     initialize_schema(conn)
 
     cur = conn.cursor()
-    if not URLS:
+    if not urls:
         print("WARNING: URLS list is empty!")
-        return
+        return 0
 
-    for source_name, url in URLS.items():
+    total = 0
+    for source_name, url in urls.items():
         print(f"Fetching {source_name}...")
         try:
-            resp = requests.get(url)
+            with stage("permits", "http_fetch"):
+                resp = requests.get(url)
             if resp.status_code != 200: continue
-            data = resp.json()
+            with stage("permits", "json_parse"):
+                data = resp.json()
             features = data.get("features", [])
             print(f"  Found {len(features)} permits.")
             
-            for feat in features:
-                record = normalize_data(source_name, feat)
-                if not record[7]: continue
-
-                sql = """
-                    INSERT INTO live_permits 
-                    (permit_id, source_layer, hazard_type, description, start_time, end_time, metadata, geom)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, ST_SetSRID(ST_GeomFromGeoJSON(%s), 4326))
-                    ON CONFLICT (permit_id) DO UPDATE SET
-                        metadata = EXCLUDED.metadata,
-                        end_time = EXCLUDED.end_time;
-                """
-                geom_json = json.dumps(record[7])
-                try:
-                    cur.execute(sql, (record[0], record[1], record[2], record[3], record[4], record[5], record[6], geom_json))
-                except Exception as row_error:
-                    conn.rollback()
-                    continue
-            conn.commit()
-            print(f"  Successfully ingested {source_name}.")
+            with stage("permits", "sql_execute"):
+                layer_rows = 0
+                for feat in features:
+                    record = normalize_data(source_name, feat)
+                    if not record[7]: continue
+
+                    sql = """
+                        INSERT INTO live_permits 
+                        (permit_id, source_layer, hazard_type, description, start_time, end_time, metadata, geom)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s, ST_SetSRID(ST_GeomFromGeoJSON(%s), 4326))
+                        ON CONFLICT (permit_id) DO UPDATE SET
+                            metadata = EXCLUDED.metadata,
+                            end_time = EXCLUDED.end_time;
+                    """
+                    geom_json = json.dumps(record[7])
+                    try:
+                        cur.execute(sql, (record[0], record[1], record[2], record[3], record[4], record[5], record[6], geom_json))
+                        layer_rows += 1
+                    except Exception as row_error:
+                        # The rollback also discards this layer's earlier rows
+                        conn.rollback()
+                        layer_rows = 0
+                        continue
+                conn.commit()
+                total += layer_rows
+            print(f"  Successfully ingested {source_name} ({layer_rows} permits).")
         except Exception as e:
             conn.rollback()
 
     cur.close()
     conn.close()
+    return total
 
 if __name__ == "__main__":
-    ingest_layers()
\ No newline at end of file
+    ingest_layers()
+    export_textfile("permits")
\ No newline at end of file
@@ -1,28 +1,12 @@
-import os
-import requests
 import zipfile
 import io
 import csv
-import psycopg2
-from dotenv import load_dotenv
-
-base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-load_dotenv(os.path.join(base_dir, '.env'))
+from engine.settings import get_db_connection
+from engine.instrumentation import stage, export_textfile
 
 # HSR Static GTFS URL
 GTFS_URL = "https://opendata.hamilton.ca/GTFS-Static/google_transit.zip"
 
-DB_PARAMS = {
-    "dbname": os.getenv("DB_NAME"),
-    "user": os.getenv("DB_USER"),
-    "password": os.getenv("DB_PASSWORD"),
-    "host": os.getenv("DB_HOST"),
-    "port": os.getenv("DB_PORT", "5432")
-}
-
-def get_db_connection():
-    return psycopg2.connect(**DB_PARAMS)
-
 def init_static_schema(cur):
     print("🔨 Creating Static Tables...")
     
@@ -99,11 +83,11 @@ def init_static_schema(cur):
     cur.execute("CREATE INDEX IF NOT EXISTS idx_shapes_id ON shapes(shape_id);")
 
 def import_csv_to_table(cur, zip_file, filename, table_name, columns):
-    """Generic CSV loader"""
+    """Generic CSV loader. Returns the number of rows read."""
     print(f"📥 Loading {table_name}...")
     if filename not in zip_file.namelist():
         print(f"⚠️  {filename} not found in zip. Skipping.")
-        return
+        return 0
 
     with zip_file.open(filename) as f:
         # Decode bytes to string
@@ -125,6 +109,7 @@ def import_csv_to_table(cur, zip_file, filename, table_name, columns):
                 print(f"   - Processed {count} rows...")
         
     print(f"✅ {table_name} complete ({count} rows).")
+    return count
 
 def generate_geometries(cur):
     print("🌍 Generating Spatial Geometries...")
@@ -150,15 +135,21 @@ def generate_geometries(cur):
     """)
     print("   - Shape Polylines created.")
 
-def ingest_static():
-    print(f"⬇️  Downloading GTFS Static from {GTFS_URL}...")
-    resp = requests.get(GTFS_URL)
+@stage("static", "ingest_static")
+def ingest_static(url=GTFS_URL):
+    """Downloads and loads the GTFS zip. Returns the number of CSV rows loaded, or None on failure."""
+    import requests
+
+    print(f"⬇️  Downloading GTFS Static from {url}...")
+    with stage("static", "http_fetch"):
+        resp = requests.get(url)
     if resp.status_code != 200:
         print("❌ Failed to download file.")
         return
 
     with zipfile.ZipFile(io.BytesIO(resp.content)) as z:
         conn = get_db_connection()
+        if not conn: return
         cur = conn.cursor()
         
         # 1. Init Schema
@@ -166,27 +157,31 @@ def ingest_static():
         conn.commit()
 
         # 2. Import Data (Order matters for foreign keys usually, but we are lenient here)
-        import_csv_to_table(cur, z, 'routes.txt', 'routes', 
-            ['route_id', 'route_short_name', 'route_long_name', 'route_type', 'route_color', 'route_text_color'])
-        
-        import_csv_to_table(cur, z, 'stops.txt', 'stops', 
-            ['stop_id', 'stop_code', 'stop_name', 'stop_lat', 'stop_lon'])
+        with stage("static", "csv_load"):
+            rows = import_csv_to_table(cur, z, 'routes.txt', 'routes', 
+                ['route_id', 'route_short_name', 'route_long_name', 'route_type', 'route_color', 'route_text_color'])
             
-        import_csv_to_table(cur, z, 'trips.txt', 'trips', 
-            ['route_id', 'service_id', 'trip_id', 'trip_headsign', 'shape_id', 'direction_id'])
-            
-        import_csv_to_table(cur, z, 'shapes.txt', 'shapes', 
-            ['shape_id', 'shape_pt_lat', 'shape_pt_lon', 'shape_pt_sequence'])
-
-        conn.commit()
+            rows += import_csv_to_table(cur, z, 'stops.txt', 'stops', 
+                ['stop_id', 'stop_code', 'stop_name', 'stop_lat', 'stop_lon'])
+                
+            rows += import_csv_to_table(cur, z, 'trips.txt', 'trips', 
+                ['route_id', 'service_id', 'trip_id', 'trip_headsign', 'shape_id', 'direction_id'])
+                
+            rows += import_csv_to_table(cur, z, 'shapes.txt', 'shapes', 
+                ['shape_id', 'shape_pt_lat', 'shape_pt_lon', 'shape_pt_sequence'])
+
+            conn.commit()
         
         # 3. Post-Process Geometries
-        generate_geometries(cur)
-        
-        conn.commit()
+        with stage("static", "geometry_build"):
+            generate_geometries(cur)
+            
+            conn.commit()
         cur.close()
         conn.close()
         print("🎉 Static GTFS Ingestion Complete!")
+        return rows
 
 if __name__ == "__main__":
-    ingest_static()
\ No newline at end of file
+    ingest_static()
+    export_textfile("static")
\ No newline at end of file
@@ -0,0 +1,156 @@
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from prometheus_client import (
+    CollectorRegistry, Histogram, generate_latest, write_to_textfile, CONTENT_TYPE_LATEST
+)
+from engine.settings import get_settings, get_db_connection, get_async_connection
+
+# --- CONFIGURATION ---
+# Resolved through engine.settings at call time:
+#   METRICS_TEXTFILE_DIR - directory scraped by node_exporter's textfile collector
+#   EXPLAIN_THRESHOLD_MS - queries slower than this get an EXPLAIN ANALYZE dump (unset = off)
+# Read by prometheus_client itself at import (set by `transitmind serve --workers N`):
+#   PROMETHEUS_MULTIPROC_DIR - per-process metric files merged by latest()
+
+# Static ingest runs for minutes, API routes for milliseconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+REGISTRY = CollectorRegistry()
+
+STAGE_SECONDS = Histogram(
+    "transitmind_stage_seconds", "Wall time of a pipeline stage.",
+    ["job", "stage"], buckets=BUCKETS, registry=REGISTRY
+)
+QUERY_SECONDS = Histogram(
+    "transitmind_query_seconds", "Wall time of a named SQL statement.",
+    ["job", "query"], buckets=BUCKETS, registry=REGISTRY
+)
+REQUEST_SECONDS = Histogram(
+    "transitmind_http_request_seconds", "API request latency by route.",
+    ["method", "route", "status"], buckets=BUCKETS, registry=REGISTRY
+)
+
+# Slow statements waiting for their EXPLAIN ANALYZE. It re-executes the statement, so it
+# runs only once nothing is being timed: after the outermost stage in the engines, and
+# as a background task after the response is sent in the API.
+_slow_queries = []
+_stage_depth = 0
+_slow_fetches = ContextVar("slow_fetches", default=())
+
+@contextmanager
+def stage(job, name):
+    """Times the enclosed block into transitmind_stage_seconds{job, stage}."""
+    global _stage_depth
+    _stage_depth += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(job, name).observe(time.perf_counter() - start)
+        _stage_depth -= 1
+        if _stage_depth == 0 and _slow_queries:
+            explain_slow_queries()
+
+def _is_slow(elapsed):
+    threshold_ms = get_settings()["explain_threshold_ms"]
+    return threshold_ms is not None and elapsed * 1000 >= threshold_ms
+
+def _explainable(sql):
+    # EXPLAIN ANALYZE executes the statement, so never re-run writes
+    return sql.lstrip().upper().startswith(("SELECT", "WITH"))
+
+def _print_plan(job, name, elapsed, plan):
+    print(f"🐢 Slow query {job}/{name}: {elapsed * 1000:.0f} ms")
+    print(plan)
+
+def timed_query(cur, job, name, sql, params=None):
+    """
+    Executes sql on a psycopg2 cursor and records its latency.
+    Slow read queries are queued for EXPLAIN ANALYZE once the outermost stage closes
+    (immediately, on a fresh connection, when called outside any stage).
+    """
+    start = time.perf_counter()
+    cur.execute(sql, params)
+    elapsed = time.perf_counter() - start
+    QUERY_SECONDS.labels(job, name).observe(elapsed)
+
+    if _is_slow(elapsed) and _explainable(sql):
+        _slow_queries.append((job, name, elapsed, sql, params))
+        if _stage_depth == 0:
+            explain_slow_queries()
+
+def explain_slow_queries():
+    """Prints the plan of every queued slow query, on its own connection."""
+    queued = _slow_queries[:]
+    _slow_queries.clear()
+    conn = get_db_connection()
+    if not conn: return
+    try:
+        cur = conn.cursor()
+        for job, name, elapsed, sql, params in queued:
+            cur.execute("EXPLAIN (ANALYZE, BUFFERS) " + sql, params)
+            _print_plan(job, name, elapsed, "\n".join(row[0] for row in cur.fetchall()))
+        cur.close()
+    except Exception as e:
+        print(f"⚠️  EXPLAIN failed: {e}")
+    finally:
+        conn.rollback()
+        conn.close()
+
+async def timed_fetchval(conn, job, name, sql, *args):
+    """
+    asyncpg counterpart of timed_query for the API's fetchval routes.
+    Slow queries are remembered for this request; see take_slow_fetches.
+    """
+    start = time.perf_counter()
+    value = await conn.fetchval(sql, *args)
+    elapsed = time.perf_counter() - start
+    QUERY_SECONDS.labels(job, name).observe(elapsed)
+
+    if _is_slow(elapsed) and _explainable(sql):
+        _slow_fetches.set(_slow_fetches.get() + ((job, name, elapsed, sql, args),))
+    return value
+
+def take_slow_fetches():
+    """Returns and forgets the slow queries timed so far in this request."""
+    slow = _slow_fetches.get()
+    _slow_fetches.set(())
+    return slow
+
+async def explain_fetches(slow):
+    """Prints the plans for take_slow_fetches(); meant to run after the response is sent."""
+    conn = await get_async_connection()
+    try:
+        for job, name, elapsed, sql, args in slow:
+            rows = await conn.fetch("EXPLAIN (ANALYZE, BUFFERS) " + sql, *args)
+            _print_plan(job, name, elapsed, "\n".join(row[0] for row in rows))
+    except Exception as e:
+        print(f"⚠️  EXPLAIN failed: {e}")
+    finally:
+        await conn.close()
+
+def export_textfile(job):
+    """
+    Writes the registry for the textfile collector.
+    No-op unless METRICS_TEXTFILE_DIR is set.
+    """
+    textfile_dir = get_settings()["metrics_textfile_dir"]
+    if not textfile_dir:
+        return
+    write_to_textfile(os.path.join(textfile_dir, f"transitmind_{job}.prom"), REGISTRY)
+
+def latest():
+    """
+    Returns (body, content_type) for a /metrics endpoint.
+    Under several API workers (PROMETHEUS_MULTIPROC_DIR set) the histograms
+    of every worker are merged, not just those of the one answering the scrape.
+    """
+    if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+    from prometheus_client import multiprocess
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
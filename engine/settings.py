@@ -0,0 +1,66 @@
+import os
+from functools import lru_cache
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def parse_ms(name, value):
+    """Milliseconds from the environment; unset or malformed values disable the feature."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        print(f"⚠️  Ignoring {name}={value!r}: not a number of milliseconds.")
+        return None
+
+@lru_cache(maxsize=None)
+def get_settings():
+    """
+    Loads .env once, on first use, and returns the resolved settings.
+    Nothing touches the environment at import time, so CLIs that never hit
+    the database (e.g. --help, --record-only) never pay for it.
+    """
+    from dotenv import load_dotenv
+    load_dotenv(os.path.join(base_dir, '.env'))
+
+    return {
+        "db_name": os.getenv("DB_NAME"),
+        "db_user": os.getenv("DB_USER"),
+        "db_password": os.getenv("DB_PASSWORD"),
+        "db_host": os.getenv("DB_HOST"),
+        "db_port": os.getenv("DB_PORT", "5432"),
+        # Observability (see engine/instrumentation.py)
+        "metrics_textfile_dir": os.getenv("METRICS_TEXTFILE_DIR"),
+        "explain_threshold_ms": parse_ms("EXPLAIN_THRESHOLD_MS", os.getenv("EXPLAIN_THRESHOLD_MS")),
+    }
+
+def db_params():
+    settings = get_settings()
+    return {
+        "dbname": settings["db_name"],
+        "user": settings["db_user"],
+        "password": settings["db_password"],
+        "host": settings["db_host"],
+        "port": settings["db_port"]
+    }
+
+def get_db_connection():
+    """psycopg2 connection for the engines. Returns None if the DB is unreachable."""
+    import psycopg2
+    try:
+        return psycopg2.connect(**db_params())
+    except Exception as e:
+        print(f"❌ Database connection failed: {e}")
+        return None
+
+async def get_async_connection():
+    """asyncpg connection for the API."""
+    import asyncpg
+    params = db_params()
+    return await asyncpg.connect(
+        user=params["user"],
+        password=params["password"],
+        database=params["dbname"],
+        host=params["host"],
+        port=params["port"]
+    )
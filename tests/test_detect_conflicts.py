@@ -0,0 +1,78 @@
+import sys
+import types
+
+import pytest
+
+from engine.detect_conflicts import sync_conflict_events
+
+GEOM = "0101000020E6100000000000000000F03F0000000000000040"
+
+class FakeCursor:
+    """Returns the given open rows for the SELECT and records every write."""
+
+    def __init__(self, open_rows):
+        self.open_rows = open_rows
+        self.writes = []
+
+    def execute(self, sql, params=None):
+        if not sql.lstrip().startswith("SELECT"):
+            self.writes.append((sql, params))
+
+    def fetchall(self):
+        return self.open_rows
+
+@pytest.fixture(autouse=True)
+def fake_execute_values(monkeypatch):
+    """Records execute_values batches on the fake cursor instead of mogrifying them."""
+    def execute_values(cur, sql, argslist, template=None):
+        cur.writes.append((sql, list(argslist)))
+
+    extras = types.ModuleType("psycopg2.extras")
+    extras.execute_values = execute_values
+    psycopg2 = types.ModuleType("psycopg2")
+    psycopg2.extras = extras
+    monkeypatch.setitem(sys.modules, "psycopg2", psycopg2)
+    monkeypatch.setitem(sys.modules, "psycopg2.extras", extras)
+
+def statements(cur, verb):
+    return [params for sql, params in cur.writes if sql.lstrip().startswith(verb)]
+
+def test_new_conflict_is_opened():
+    cur = FakeCursor([])
+    detected, opened, closed = sync_conflict_events(cur, [("HARD_BLOCK", "1", "Road closed", "FULL", GEOM)])
+
+    assert detected == 1
+    assert opened == [("HARD_BLOCK", "1", "Road closed", "FULL")]
+    assert closed == []
+    assert statements(cur, "INSERT") == [[("HARD_BLOCK", "1", "Road closed", "FULL", GEOM)]]
+    # A concurrent detect process may already have opened it
+    assert "ON CONFLICT DO NOTHING" in cur.writes[0][0]
+
+def test_unchanged_conflict_writes_nothing():
+    cur = FakeCursor([(7, "HARD_BLOCK", "1", "Road closed", "FULL", GEOM)])
+    detected, opened, closed = sync_conflict_events(cur, [("HARD_BLOCK", "1", "Road closed", "FULL", GEOM)])
+
+    assert (detected, opened, closed) == (1, [], [])
+    assert cur.writes == []
+
+def test_cleared_conflict_is_closed():
+    cur = FakeCursor([(7, "HARD_BLOCK", "1", "Road closed", "FULL", GEOM)])
+    detected, opened, closed = sync_conflict_events(cur, [])
+
+    assert detected == 0
+    assert closed == [("HARD_BLOCK", "1", "Road closed", "FULL")]
+    assert statements(cur, "UPDATE conflict_events SET closed_at") == [([7],)]
+
+def test_metric_change_is_updated_in_place():
+    cur = FakeCursor([(7, "SQUEEZE", "5", "Lane closure", "20%", GEOM)])
+    detected, opened, closed = sync_conflict_events(cur, [("SQUEEZE", "5", "Lane closure", "35%", GEOM)])
+
+    assert (opened, closed) == ([], [])
+    assert statements(cur, "UPDATE conflict_events SET metric") == [[("35%", 7)]]
+
+def test_live_impact_speed_change_writes_nothing():
+    cur = FakeCursor([(7, "LIVE_IMPACT", "BUS-1", "Road closed", "4.0 km/h", GEOM)])
+    detected, opened, closed = sync_conflict_events(cur, [("LIVE_IMPACT", "BUS-1", "Road closed", "2.5 km/h", GEOM)])
+
+    assert (detected, opened, closed) == (1, [], [])
+    assert cur.writes == []
@@ -1,11 +1,11 @@
-import os
-import asyncpg
-from fastapi import FastAPI, Response
+import time
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from dotenv import load_dotenv
-
-base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-load_dotenv(os.path.join(base_dir, '.env'))
+from starlette.background import BackgroundTask
+from engine.settings import get_async_connection
+from engine.instrumentation import (
+    REQUEST_SECONDS, stage, timed_fetchval, take_slow_fetches, explain_fetches, latest
+)
 
 app = FastAPI()
 
@@ -16,14 +16,24 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_latency(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    # Label by route template, not raw path, to keep cardinality bounded
+    route = request.scope.get("route")
+    path = route.path if route else "unmatched"
+    REQUEST_SECONDS.labels(request.method, path, str(response.status_code)).observe(time.perf_counter() - start)
+    return response
+
 async def get_db_connection():
-    return await asyncpg.connect(
-        user=os.getenv("DB_USER"),
-        password=os.getenv("DB_PASSWORD"),
-        database=os.getenv("DB_NAME"),
-        host=os.getenv("DB_HOST"),
-        port=os.getenv("DB_PORT", "5432")
-    )
+    with stage("api", "db_connect"):
+        return await get_async_connection()
+
+def explain_later():
+    """EXPLAIN ANALYZE for this request's slow queries, run after the response is sent."""
+    slow = take_slow_fetches()
+    return BackgroundTask(explain_fetches, slow) if slow else None
 
 @app.get("/static/routes")
 async def get_static_routes():
@@ -51,8 +61,8 @@ async def get_static_routes():
             JOIN routes r ON t.route_id = r.route_id
             GROUP BY r.route_id, r.route_short_name, r.route_color, r.route_text_color, sg.geom;
         """
-        geojson = await conn.fetchval(query)
-        return Response(content=geojson, media_type="application/json")
+        geojson = await timed_fetchval(conn, "api", "static_routes", query)
+        return Response(content=geojson, media_type="application/json", background=explain_later())
     finally:
         await conn.close()
 
@@ -83,13 +93,35 @@ async def get_live_buses():
                 ORDER BY vehicle_id, timestamp DESC
             ) t;
         """
-        geojson = await conn.fetchval(query)
-        return Response(content=geojson, media_type="application/json")
+        geojson = await timed_fetchval(conn, "api", "live_buses", query)
+        return Response(content=geojson, media_type="application/json", background=explain_later())
     finally:
         await conn.close()
 
 @app.get("/conflicts")
 async def get_conflicts():
+    conn = await get_db_connection()
+    try:
+        # Serves the open set maintained by engine/detect_conflicts.py,
+        # so the diagnostics are never re-run per request
+        query = """
+            SELECT json_build_object(
+                'type', 'FeatureCollection',
+                'features', COALESCE(json_agg(ST_AsGeoJSON(t.*)::json), '[]'::json)
+            ) 
+            FROM (
+                SELECT id, conflict_type, target_id, description, metric, first_seen, geom
+                FROM conflict_events
+                WHERE closed_at IS NULL
+            ) t;
+        """
+        geojson = await timed_fetchval(conn, "api", "conflicts", query)
+        return Response(content=geojson, media_type="application/json", background=explain_later())
+    finally:
+        await conn.close()
+
+@app.get("/permits")
+async def get_permits():
     conn = await get_db_connection()
     try:
         query = """
@@ -103,8 +135,13 @@ async def get_conflicts():
                 WHERE metadata->>'status' IN ('Active', 'Authorised')
             ) t;
         """
-        geojson = await conn.fetchval(query)
+        geojson = await timed_fetchval(conn, "api", "permits", query)
         # FIX: Return raw pre-formatted JSON
-        return Response(content=geojson, media_type="application/json")
+        return Response(content=geojson, media_type="application/json", background=explain_later())
     finally:
         await conn.close()
+
+@app.get("/metrics")
+async def get_metrics():
+    body, content_type = latest()
+    return Response(content=body, media_type=content_type)